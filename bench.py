@@ -0,0 +1,381 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#   "duckdb>=1.0",
+#   "pandas",
+#   "rich",
+# ]
+# ///
+
+"""
+Anime EDA Benchmark
+
+Usage:
+  uv run bench.py                              # 1x（Kaggle 相当）で計測し JSON を標準出力へ
+  uv run bench.py --scale 1 10 100             # 1x / 10x / 100x を順に計測
+  uv run bench.py --scale 10 -o bench.json     # 結果を JSON ファイルへ保存
+  uv run bench.py --engine pandas duckdb --chunksize 1000000
+  uv run bench.py --startup-only --startup-budget 150   # eda.py の起動時間だけを計測し、予算超過で失敗
+
+設計方針:
+  - generate()      : DuckDB の SQL で MyAnimeList 形状の合成データを生成（ハッシュベースで決定的）
+  - 各ステージ      : 別プロセスで実行し、os.wait4() でそのプロセス単体のピーク RSS を取得
+  - eda ワーカー    : build_view / fetch_data（セクション単位）/ render_html の経過時間を計測
+  - 起動時間        : python -X importtime で eda の import 時間を分解し、--help の経過時間も計測
+  → 結果は JSON で出力し、バージョン間の性能回帰を追跡できるようにする
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import duckdb
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Kaggle 版 MyAnimeList データセットの規模（1x）
+KAGGLE_ANIME = 12_294
+KAGGLE_USERS = 73_516
+KAGGLE_RATINGS = 7_813_737
+
+GENRES = [
+    "Action", "Adventure", "Cars", "Comedy", "Dementia", "Demons", "Drama",
+    "Ecchi", "Fantasy", "Game", "Harem", "Hentai", "Historical", "Horror",
+    "Josei", "Kids", "Magic", "Martial Arts", "Mecha", "Military", "Music",
+    "Mystery", "Parody", "Police", "Psychological", "Romance", "Samurai",
+    "School", "Sci-Fi", "Seinen", "Shoujo", "Shoujo Ai", "Shounen",
+    "Shounen Ai", "Slice of Life", "Space", "Sports", "Super Power",
+    "Supernatural", "Thriller", "Vampire", "Yaoi", "Yuri",
+]
+
+
+# ══════════════════════════════════════════════════════════
+# 合成データ生成
+# ══════════════════════════════════════════════════════════
+
+def generate(raw_dir: Path, scale: int, seed: int = 0) -> dict:
+    """data/raw/ 相当の anime.csv / rating.csv を生成し、行数を返す
+
+    乱数は hash(行番号, 系列, seed) から作るため、スレッド数によらず同じ内容になる。
+    anime_id は飛び番、rating.csv には -1（未評価）と anime.csv に存在しない id を含む。
+    """
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    n_anime = KAGGLE_ANIME * scale
+    n_users = KAGGLE_USERS * scale
+    n_ratings = KAGGLE_RATINGS * scale
+
+    con = duckdb.connect()
+    # 一様乱数 [0, 1) と標準正規乱数（Box-Muller）
+    con.execute(f"""
+    CREATE MACRO u(i, k) AS (hash(i, k, {seed}) % 1000003) / 1000003.0;
+    CREATE MACRO z(i, k) AS
+        SQRT(-2 * LN(1 - u(i, k))) * COS(2 * PI() * u(i, k + 100));
+    """)
+    genres = "[" + ", ".join(f"'{g}'" for g in GENRES) + "]"
+
+    con.execute(f"""
+    COPY (
+        SELECT
+            1 + 3 * i AS anime_id,
+            CASE
+                WHEN u(i, 1) < 0.03 THEN 'Gintama&#039; ' || i
+                WHEN u(i, 1) < 0.05 THEN 'Fate/stay night &amp; ' || i
+                WHEN u(i, 1) < 0.07 THEN 'Title, with comma ' || i
+                ELSE 'Anime ' || i
+            END AS name,
+            CASE WHEN u(i, 2) < 0.005 THEN NULL ELSE array_to_string(list_slice(
+                list_distinct([{genres}[1 + (hash(i, k, {seed}) % {len(GENRES)})::BIGINT]
+                               FOR k IN range(4)]),
+                1, 1 + (hash(i, 3, {seed}) % 4)::INTEGER), ', ')
+            END AS genre,
+            CASE
+                WHEN u(i, 4) < 0.002 THEN NULL
+                WHEN u(i, 4) < 0.30  THEN 'TV'
+                WHEN u(i, 4) < 0.57  THEN 'OVA'
+                WHEN u(i, 4) < 0.76  THEN 'Movie'
+                WHEN u(i, 4) < 0.90  THEN 'Special'
+                WHEN u(i, 4) < 0.955 THEN 'ONA'
+                ELSE 'Music'
+            END AS type,
+            CASE
+                WHEN u(i, 5) < 0.03 THEN 'Unknown'
+                ELSE (1 + FLOOR(POW(u(i, 6), 4) * 300))::INTEGER::VARCHAR
+            END AS episodes,
+            CASE WHEN u(i, 7) < 0.02 THEN NULL
+                 ELSE ROUND(LEAST(10, GREATEST(1.67, 6.47 + 1.03 * z(i, 8))), 2)
+            END AS rating,
+            LEAST(1013917, GREATEST(5, EXP(7.4 + 2.0 * z(i, 9))))::BIGINT AS members
+        FROM range({n_anime}) t(i)
+    ) TO '{raw_dir / "anime.csv"}' (FORMAT csv, HEADER)
+    """)
+
+    # ユーザー活動量・アニメ人気ともに裾の重い分布にする。0.3% は未知の anime_id
+    con.execute(f"""
+    COPY (
+        SELECT
+            1 + FLOOR({n_users} * POW(u(i, 11), 1.6))::BIGINT AS user_id,
+            CASE
+                WHEN u(i, 12) < 0.003
+                    THEN 1 + 3 * ({n_anime} + hash(i, 13, {seed}) % 1000)
+                ELSE 1 + 3 * FLOOR({n_anime} * POW(u(i, 14), 3))::BIGINT
+            END AS anime_id,
+            CASE WHEN u(i, 15) < 0.19 THEN -1
+                 ELSE LEAST(10, GREATEST(1, ROUND(7.8 + 1.7 * z(i, 16))))::INTEGER
+            END AS rating
+        FROM range({n_ratings}) t(i)
+    ) TO '{raw_dir / "rating.csv"}' (FORMAT csv, HEADER)
+    """)
+    con.close()
+    return {"anime": n_anime, "users": n_users, "rating": n_ratings}
+
+
+# ══════════════════════════════════════════════════════════
+# 計測
+# ══════════════════════════════════════════════════════════
+
+def _peak_rss_mb(rusage) -> float:
+    # ru_maxrss は Linux では KiB、macOS ではバイト
+    kib = rusage.ru_maxrss / 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    return round(kib / 1024, 1)
+
+
+def run_stage(cmd: list[str], cwd: Path) -> dict:
+    """コマンドを子プロセスで実行し、経過時間・ピーク RSS・標準出力を返す"""
+    with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=err)
+        # Popen.wait() では子プロセスの rusage が取れないので wait4 で直接回収する
+        _, status, rusage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        out.seek(0)
+        err.seek(0)
+        if proc.returncode:
+            raise RuntimeError(f"{' '.join(cmd)} failed:\n{err.read()}")
+        return {"seconds": round(seconds, 3),
+                "peak_rss_mb": _peak_rss_mb(rusage),
+                "stdout": out.read()}
+
+
+def eda_worker(data_path: str, materialize: bool, workers: int) -> dict:
+    """eda.py の各ステージを 1 プロセス内で計測する（run_stage から呼ばれる）"""
+    import eda
+
+    timings = {}
+    t0 = time.perf_counter()
+    con = duckdb.connect()
+    eda.build_view(con, data_path, materialize=materialize)
+    timings["build_view"] = time.perf_counter() - t0
+
+    profiler = eda.QueryProfiler()
+    t0 = time.perf_counter()
+    data = eda.fetch_data(con, profiler, workers=workers)
+    timings["fetch_data"] = time.perf_counter() - t0
+    con.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        eda.render_html(data, Path(tmp) / "report.html")
+        timings["render_html"] = time.perf_counter() - t0
+
+    # DuckDB のオペレータツリーは大きいので、ベンチ結果には集計値だけを残す
+    queries = [{k: v for k, v in r.items() if k != "profile"} for r in profiler.records]
+    return {"stages": {k: round(v, 4) for k, v in timings.items()},
+            "queries": queries}
+
+
+# import 時に読み込まれていたら起動経路の退行とみなすモジュール（使う関数の中で import する）
+LAZY_MODULES = ("duckdb", "rich", "http.server", "concurrent.futures")
+
+
+def parse_importtime(stderr: str) -> list[dict]:
+    """python -X importtime の出力を [{module, depth, self_ms, cumulative_ms}, ...] に変換する"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():  # ヘッダ行
+            continue
+        module = name.strip()
+        rows.append({
+            "module": module,
+            "depth": (len(name.rstrip()) - len(module) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return rows
+
+
+def bench_startup(repeat: int = 5) -> dict:
+    """eda.py の import 時間と --help の経過時間を repeat 回計測し、最小値を返す
+
+    import 時間は -X importtime の eda の累積値。最後の計測から、eda が直接 import する
+    モジュールの内訳と、遅延 import すべきモジュールが読み込まれていないかも記録する。
+    """
+    import_ms, help_seconds = [], []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import eda"],
+                              cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        rows = parse_importtime(proc.stderr)
+        import_ms.append(next(r["cumulative_ms"] for r in rows if r["module"] == "eda"))
+        help_seconds.append(
+            run_stage([sys.executable, str(REPO_DIR / "eda.py"), "--help"], REPO_DIR)["seconds"])
+
+    # -X importtime は子 → 親の順に出力するので、eda の行から遡って直前のトップレベルまでが eda の部分木
+    end = next(i for i, r in enumerate(rows) if r["module"] == "eda")
+    start = max((i + 1 for i in range(end) if rows[i]["depth"] == 0), default=0)
+    subtree = rows[start:end]
+    loaded = {r["module"] for r in subtree}
+    direct = sorted((r for r in subtree if r["depth"] == 1), key=lambda r: -r["cumulative_ms"])
+    return {
+        "import_ms": round(min(import_ms), 1),
+        "help_seconds": min(help_seconds),
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in loaded],
+        "top_imports": [{"module": r["module"], "cumulative_ms": r["cumulative_ms"]}
+                        for r in direct[:10]],
+    }
+
+
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "duckdb": duckdb.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def bench_scale(scale: int, workdir: Path, engines: list[str], chunksize: int | None,
+                materialize: bool, workers: int, regenerate: bool) -> dict:
+    root = workdir / f"x{scale}"
+    raw_dir = root / "data" / "raw"
+    result = {
+        "scale": scale,
+        "rows": {"anime": KAGGLE_ANIME * scale, "users": KAGGLE_USERS * scale,
+                 "rating": KAGGLE_RATINGS * scale},
+        "stages": {},
+    }
+
+    if regenerate or not (raw_dir / "rating.csv").exists():
+        print(f"⚙️  Generating x{scale} dataset → {raw_dir}", file=sys.stderr)
+        t0 = time.perf_counter()
+        generate(raw_dir, scale)
+        result["stages"]["generate"] = {"seconds": round(time.perf_counter() - t0, 3)}
+
+    variants = [(e, [sys.executable, str(REPO_DIR / "preprocess.py"), "--engine", e])
+                for e in engines]
+    if chunksize:
+        variants.append(("pandas-chunked",
+                         [sys.executable, str(REPO_DIR / "preprocess.py"),
+                          "--chunksize", str(chunksize)]))
+    for name, cmd in variants:
+        print(f"⏱️  x{scale} preprocess[{name}]", file=sys.stderr)
+        stage = run_stage(cmd, root)
+        del stage["stdout"]
+        result["stages"][f"preprocess[{name}]"] = stage
+
+    print(f"⏱️  x{scale} eda", file=sys.stderr)
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--eda-worker",
+           str(root / "data" / "processed" / "anime_processed.csv")]
+    if materialize:
+        cmd.append("--materialize")
+    cmd += ["--workers", str(workers)]
+    stage = run_stage(cmd, root)
+    worker = json.loads(stage.pop("stdout"))
+    result["stages"]["eda"] = {**stage, **worker["stages"]}
+    result["queries"] = worker["queries"]
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Anime EDA benchmark")
+    parser.add_argument(
+        "--scale", type=int, nargs="+", default=[1],
+        help="Kaggle データセットに対する倍率 (default: 1)"
+    )
+    parser.add_argument(
+        "--workdir", type=Path, default=Path(".cache/bench"),
+        help="合成データ・中間生成物の置き場所 (default: .cache/bench/)"
+    )
+    parser.add_argument(
+        "--engine", choices=["pandas", "duckdb"], nargs="+", default=["pandas", "duckdb"],
+        help="計測する preprocess.py のエンジン (default: pandas duckdb)"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="指定すると preprocess.py --chunksize のストリーミングモードも計測する"
+    )
+    parser.add_argument(
+        "--materialize", action="store_true",
+        help="eda.py の build_view をインメモリテーブル化して計測する"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="eda.py の fetch_data() を並行実行するスレッド数 (default: 1)"
+    )
+    parser.add_argument(
+        "--regenerate", action="store_true",
+        help="既存の合成データがあっても作り直す"
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, default=None,
+        help="結果 JSON の出力先 (default: 標準出力)"
+    )
+    parser.add_argument(
+        "--startup-only", action="store_true",
+        help="合成データを使うステージを省き、eda.py の起動時間だけを計測する"
+    )
+    parser.add_argument(
+        "--startup-budget", type=float, default=None, metavar="MS",
+        help="eda の import 時間の上限（ミリ秒）。超えた場合や遅延 import すべきモジュールが"
+             "読み込まれた場合は終了コード 1 で失敗する（CI 向け）"
+    )
+    parser.add_argument("--eda-worker", metavar="DATA", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.eda_worker:
+        json.dump(eda_worker(args.eda_worker, args.materialize, args.workers), sys.stdout)
+        return
+
+    print("⏱️  eda startup", file=sys.stderr)
+    results = {"meta": _meta(), "startup": bench_startup(), "runs": []}
+    for scale in [] if args.startup_only else args.scale:
+        results["runs"].append(bench_scale(
+            scale, args.workdir.resolve(), args.engine, args.chunksize,
+            args.materialize, args.workers, args.regenerate,
+        ))
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text + "\n", encoding="utf-8")
+        print(f"✅ Benchmark results saved → {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    startup = results["startup"]
+    if args.startup_budget is not None:
+        if startup["import_ms"] > args.startup_budget:
+            sys.exit(f"❌ eda import took {startup['import_ms']}ms "
+                     f"(budget {args.startup_budget:g}ms)")
+        if startup["eager_lazy_modules"]:
+            sys.exit(f"❌ eda imports {', '.join(startup['eager_lazy_modules'])} at module level")
+
+
+if __name__ == "__main__":
+    main()
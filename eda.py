@@ -14,33 +14,136 @@ Usage:
   uv run eda.py --report html            # HTML レポートのみ
   uv run eda.py --report both            # コンソール + HTML
   uv run eda.py --report html -o out/    # 出力先ディレクトリ指定
+  uv run eda.py --ratings                # 評価データ（rating_processed）の分析も追加
+  uv run eda.py --approx                 # 分位点をスケッチで近似集計（巨大な入力向け）
+  uv run eda.py --serve 8000             # ローカル HTTP サーバーでレポートと JSON を配信
+  uv run eda.py --data "snapshots/*/anime_processed.csv" --report html   # 複数データセット + index.html
 
 設計方針:
   - fetch_data()   : DuckDB でクエリを実行し、純粋な Python dict を返す（データ層）
   - render_console(): dict を受け取り Rich でターミナル表示（出力層）
   - render_html()  : dict を受け取り HTML ファイルを生成（出力層）
   → 出力形式を増やしても fetch_data() には一切触れない疎結合設計
+  - duckdb / rich / http.server は使う関数の中で import する
+    （--help や --report html、キャッシュヒット時に不要なモジュールを読み込まない）
 """
 
+from __future__ import annotations
+
 import argparse
+import base64
+import glob
+import hashlib
 import json
+import os
+import shutil
 import sys
+import threading
+import time
+import zlib
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from http.server import BaseHTTPRequestHandler
 
-import duckdb
-from rich.console import Console
-from rich.table import Table
-from rich import print as rprint
+    import duckdb
+    from rich.console import Console
 
 # ══════════════════════════════════════════════════════════
 # データ層 — DuckDB クエリを実行し Python dict を返す
 # ══════════════════════════════════════════════════════════
 
-def build_view(con: duckdb.DuckDBPyConnection, data_path: str) -> None:
-    """CSV を DuckDB ビューとして登録する"""
+DUCKDB_SUFFIXES = (".duckdb", ".db")
+
+
+def _scan(con: duckdb.DuckDBPyConnection, data_path: str,
+          table: str = "anime", alias: str = "src") -> str:
+    """拡張子からファイル形式を判定し、FROM 句に書くテーブル式を返す
+
+    .duckdb は preprocess.py --duckdb が作るデータベースを読み取り専用で `alias` としてアタッチし、
+    テキストを再パースせずに型付きの列ストア（`table` テーブル）を直接読む。
+    """
+    suffix = Path(data_path).suffix.lower()
+    if suffix == ".parquet":
+        return f"read_parquet('{data_path}')"
+    if suffix in DUCKDB_SUFFIXES:
+        con.execute(f"DETACH DATABASE IF EXISTS {alias}")
+        con.execute(f"ATTACH '{data_path}' AS {alias} (READ_ONLY)")
+        return f"{alias}.{table}"
+    return f"read_csv_auto('{data_path}', header=true)"
+
+
+GENRE_TABLES = ("genre", "anime_genre", "anime_id_map")
+# preprocess.py が出力するアニメ表のファイル名（拡張子なし）
+PROCESSED_ANIME = "anime_processed"
+
+
+def genre_table_files(data_path: str) -> dict[str, Path]:
+    """data_path と組になるジャンル表ファイル（存在は問わない）を返す
+
+    ジャンル表は preprocess.py が anime_processed と同時に書き出したものなので、
+    データファイルが anime_processed.* のときだけ同じディレクトリ・同じ拡張子のファイルを対象にする。
+    それ以外（地域別のバリアントや手で絞り込んだ CSV など）や .duckdb では空。
+    """
+    path = Path(data_path)
+    if path.stem != PROCESSED_ANIME or path.suffix.lower() in DUCKDB_SUFFIXES:
+        return {}
+    return {n: path.with_name(n + path.suffix) for n in GENRE_TABLES}
+
+
+def _genre_scans(con: duckdb.DuckDBPyConnection, data_path: str,
+                 alias: str = "src") -> dict | None:
+    """preprocess.py が出力した genre / anime_genre / anime_id_map のテーブル式を返す
+
+    .duckdb ならアタッチ済みの `alias` に、anime_processed.* なら同じディレクトリに
+    3 つとも揃っている場合のみ返し、それ以外は None。
+    """
+    path = Path(data_path)
+    if path.suffix.lower() in DUCKDB_SUFFIXES:
+        found = con.execute("""
+            SELECT COUNT(DISTINCT table_name) FROM duckdb_tables()
+            WHERE database_name = ? AND table_name IN (?, ?, ?)
+        """, [alias, *GENRE_TABLES]).fetchone()[0]
+        return {n: f"{alias}.{n}" for n in GENRE_TABLES} if found == len(GENRE_TABLES) else None
+    files = genre_table_files(data_path)
+    if not files or not all(f.is_file() for f in files.values()):
+        return None
+    return {n: _scan(con, str(f)) for n, f in files.items()}
+
+
+def register_stat_macros(con: duckdb.DuckDBPyConnection, approx: bool = False) -> None:
+    """分位点の集計関数をマクロとして登録する
+
+    各セクションは stat_quantile() を呼ぶ。approx=True では approx_quantile（T-Digest）に置き換わり、
+    列全体をソート・保持せずに固定サイズのスケッチで集計する。
+    stats_approx() は結果が近似値かどうかをレポートへ伝える。
+    """
+    if approx:
+        con.execute("CREATE OR REPLACE MACRO stat_quantile(x, q) AS approx_quantile(x, q)")
+    else:
+        con.execute("CREATE OR REPLACE MACRO stat_quantile(x, q) AS quantile_cont(x, q)")
+    con.execute(f"CREATE OR REPLACE MACRO stats_approx() AS {str(approx).lower()}")
+
+
+def build_view(con: duckdb.DuckDBPyConnection, data_path: str,
+               materialize: bool = False, approx: bool = False, alias: str = "src") -> None:
+    """CSV / Parquet / DuckDB データベースを DuckDB ビューとして登録する
+
+    materialize=True の場合はビューではなくインメモリテーブルとして一度だけ読み込み、
+    以降の全クエリがファイルを再スキャン・再パースしないようにする。
+    あわせて genre(genre_id, genre) と anime_genre(anime_id, genre_id) を登録する。
+    preprocess.py が出力したジャンル辞書・ブリッジがあればそれを読み、ジャンル集計は
+    整数結合だけで済む。無ければ anime.genre を str_split で展開して同じ形に組み立てる。
+    approx は register_stat_macros() に渡す（分位点を近似で集計する）。
+    alias は .duckdb をアタッチする名前（アタッチは接続全体で共有されるため、
+    1 本の接続で複数のデータセットを扱う fetch_many() ではデータセットごとに変える）。
+    """
+    register_stat_macros(con, approx)
+    kind = "TABLE" if materialize else "VIEW"
     con.execute(f"""
-    CREATE OR REPLACE VIEW anime AS
+    CREATE OR REPLACE {kind} anime AS
     SELECT
         anime_id,
         name,
@@ -49,231 +152,696 @@ def build_view(con: duckdb.DuckDBPyConnection, data_path: str) -> None:
         TRY_CAST(episodes AS DOUBLE)  AS episodes,
         TRY_CAST(rating   AS DOUBLE)  AS rating,
         members
-    FROM read_csv_auto('{data_path}', header=true)
+    FROM {_scan(con, data_path, alias=alias)}
+    """)
+
+    genre_scans = _genre_scans(con, data_path, alias)
+    if genre_scans is None:
+        con.execute(f"""
+        CREATE OR REPLACE {kind} genre AS
+        SELECT DENSE_RANK() OVER (ORDER BY genre) - 1 AS genre_id, genre
+        FROM (
+            SELECT DISTINCT TRIM(g) AS genre
+            FROM anime, UNNEST(str_split(anime.genre, ',')) AS t(g)
+            WHERE TRIM(g) <> ''
+        )
+        """)
+        con.execute(f"""
+        CREATE OR REPLACE {kind} anime_genre AS
+        WITH pairs AS (
+            SELECT DISTINCT anime_id, TRIM(g) AS genre
+            FROM anime, UNNEST(str_split(anime.genre, ',')) AS t(g)
+        )
+        SELECT p.anime_id, g.genre_id
+        FROM pairs p JOIN genre g USING (genre)
+        """)
+        return
+    # ブリッジは anime_idx キーなので、anime ビューと結合できるよう anime_id に戻す
+    con.execute(f"""
+    CREATE OR REPLACE {kind} genre AS
+    SELECT genre_id, genre FROM {genre_scans['genre']}
+    """)
+    con.execute(f"""
+    CREATE OR REPLACE {kind} anime_genre AS
+    SELECT m.anime_id, b.genre_id
+    FROM {genre_scans['anime_genre']} b
+    JOIN {genre_scans['anime_id_map']} m USING (anime_idx)
     """)
 
 
-def fetch_data(con: duckdb.DuckDBPyConnection) -> dict:
-    """全分析クエリを実行し、結果を dict にまとめて返す"""
+def rating_source(data_path: str, rating_path: str | None = None) -> str:
+    """--ratings で分析する評価データのパスを決める
 
-    # 1. 概要
-    total_rows = con.execute("SELECT COUNT(*) FROM anime").fetchone()[0]
-    col_info = con.execute("DESCRIBE anime").fetchall()
+    省略時は --data と同じ場所を使う（.duckdb なら同じデータベースの rating テーブル、
+    それ以外は同じディレクトリ・同じ拡張子の rating_processed）。
+    """
+    if rating_path:
+        return rating_path
+    path = Path(data_path)
+    if path.suffix.lower() in DUCKDB_SUFFIXES:
+        return data_path
+    return str(path.with_name("rating_processed" + path.suffix))
+
+
+def build_rating_view(con: duckdb.DuckDBPyConnection, data_path: str,
+                      rating_path: str, alias: str = "src") -> None:
+    """評価データ（rating_processed や raw の rating.csv）を rating ビューとして登録する
+
+    数百万行あるため常にビューのままにし、各集計は DuckDB がストリーミングで実行する
+    （memory_limit を超える分は一時ファイルへ退避される）。未評価（-1）は除く。
+    """
+    same_db = (Path(rating_path).suffix.lower() in DUCKDB_SUFFIXES
+               and Path(rating_path).resolve() == Path(data_path).resolve())
+    source = f"{alias}.rating" if same_db else _scan(con, rating_path, "rating", f"rating_{alias}")
+    con.execute(f"""
+    CREATE OR REPLACE VIEW rating AS
+    SELECT user_id, anime_id, rating
+    FROM {source}
+    WHERE rating <> -1
+    """)
+
+
+# ── 各セクションは独立したクエリで、結果 dict の一部を返す。
+#    fetch_data() はセクション名ごとに実行し（--profile ではセクション単位で計測）、結果をまとめる。
 
-    # 2. 基本統計
-    stats = con.execute("""
+def _sec_summary(con) -> dict:
+    """1〜3. 概要・基本統計・欠損値、および 10. の相関・回帰係数
+
+    スカラー集計は 1 クエリにまとめ、anime を 1 回スキャンするだけで済ませる。
+    分位点は stat_quantile()（register_stat_macros()）経由で、--approx ではスケッチになる。
+    """
+    cur = con.execute("""
     SELECT
         COUNT(*)                                    AS count,
         ROUND(AVG(rating),   3)                     AS rating_mean,
         ROUND(STDDEV(rating),3)                     AS rating_std,
         MIN(rating)                                 AS rating_min,
-        ROUND(QUANTILE_CONT(rating, 0.25), 3)       AS rating_q1,
-        ROUND(QUANTILE_CONT(rating, 0.50), 3)       AS rating_median,
-        ROUND(QUANTILE_CONT(rating, 0.75), 3)       AS rating_q3,
+        stat_quantile(rating, [0.25, 0.5, 0.75])::DECIMAL(18,3)[]::DOUBLE[] AS rating_q,
         MAX(rating)                                 AS rating_max,
         ROUND(AVG(members),  0)                     AS members_mean,
         MIN(members)                                AS members_min,
-        QUANTILE_CONT(members, 0.25)::BIGINT        AS members_q1,
-        QUANTILE_CONT(members, 0.50)::BIGINT        AS members_median,
-        QUANTILE_CONT(members, 0.75)::BIGINT        AS members_q3,
+        stat_quantile(members, [0.25, 0.5, 0.75])::BIGINT[]                 AS members_q,
         MAX(members)                                AS members_max,
         ROUND(AVG(episodes), 2)                     AS episodes_mean,
         MIN(episodes)                               AS episodes_min,
-        QUANTILE_CONT(episodes, 0.25)::INTEGER      AS episodes_q1,
-        QUANTILE_CONT(episodes, 0.50)::INTEGER      AS episodes_median,
-        QUANTILE_CONT(episodes, 0.75)::INTEGER      AS episodes_q3,
-        MAX(episodes)                               AS episodes_max
+        stat_quantile(episodes, [0.25, 0.5, 0.75])::INTEGER[]               AS episodes_q,
+        MAX(episodes)                               AS episodes_max,
+        COUNT(*) - COUNT(name)                      AS name_null,
+        COUNT(*) - COUNT(genre)                     AS genre_null,
+        COUNT(*) - COUNT(type)                      AS type_null,
+        COUNT(*) - COUNT(episodes)                  AS episodes_null,
+        COUNT(*) - COUNT(rating)                    AS rating_null,
+        COUNT(*) - COUNT(members)                   AS members_null,
+        -- FILTER は引数の評価後に効くので、LOG(0) は引数側の CASE で NULL にして避ける
+        ROUND(CORR(rating, LOG(CASE WHEN members > 0 THEN members END))
+              FILTER (WHERE rating IS NOT NULL), 4)                           AS corr,
+        ROUND(REGR_SLOPE(LOG(CASE WHEN members > 0 THEN members END), rating)
+              FILTER (WHERE rating IS NOT NULL), 4)                           AS reg_slope,
+        ROUND(REGR_INTERCEPT(LOG(CASE WHEN members > 0 THEN members END), rating)
+              FILTER (WHERE rating IS NOT NULL), 4)                           AS reg_intercept,
+        stats_approx()                              AS approx
     FROM anime
-    """).fetchone()
+    """)
+    sc = dict(zip([d[0] for d in cur.description], cur.fetchone()))
+    # 分位点は列ごとに 1 つの集計（リスト）で求めている
+    for col in ("rating", "members", "episodes"):
+        sc[f"{col}_q1"], sc[f"{col}_median"], sc[f"{col}_q3"] = sc.pop(f"{col}_q") or [None] * 3
 
-    # 3. 欠損値
-    missing_raw = con.execute("""
-    SELECT
-        COUNT(*) - COUNT(name)     AS name_null,
-        COUNT(*) - COUNT(genre)    AS genre_null,
-        COUNT(*) - COUNT(type)     AS type_null,
-        COUNT(*) - COUNT(episodes) AS episodes_null,
-        COUNT(*) - COUNT(rating)   AS rating_null,
-        COUNT(*) - COUNT(members)  AS members_null
-    FROM anime
-    """).fetchone()
     missing_labels = ["name", "genre", "type", "episodes (Unknown→NULL)", "rating", "members"]
-    missing = [{"column": lbl, "null_count": v} for lbl, v in zip(missing_labels, missing_raw)]
+    missing_cols = ["name", "genre", "type", "episodes", "rating", "members"]
+    return {
+        "total_rows": sc["count"],
+        "stats": {
+            "count": sc["count"],
+            "rating":  {k: sc[f"rating_{k}"] for k in ("mean", "std", "min", "q1", "median", "q3", "max")},
+            "members": {k: int(sc[f"members_{k}"]) for k in ("mean", "min", "q1", "median", "q3", "max")},
+            "episodes":{k: sc[f"episodes_{k}"] for k in ("mean", "min", "q1", "median", "q3", "max")},
+        },
+        "missing": [{"column": lbl, "null_count": sc[f"{c}_null"]}
+                    for lbl, c in zip(missing_labels, missing_cols)],
+        "rating_members_corr": sc["corr"],
+        "reg_slope": sc["reg_slope"],
+        "reg_intercept": sc["reg_intercept"],
+        "approx": sc["approx"],
+    }
 
-    # 4. タイプ別分布
-    type_dist = [
+
+def _sec_col_info(con) -> dict:
+    col_info = con.execute("DESCRIBE anime").fetchall()
+    return {"col_info": [{"column": c[0], "type": c[1]} for c in col_info]}
+
+
+def _sec_type_dist(con) -> dict:
+    """4. タイプ別分布"""
+    return {"type_dist": [
         {"type": r[0], "count": r[1], "avg_rating": r[2],
          "avg_members": int(r[3]) if r[3] else None}
         for r in con.execute("""
             SELECT type, COUNT(*), ROUND(AVG(rating),2), ROUND(AVG(members),0)
             FROM anime GROUP BY type ORDER BY 2 DESC
         """).fetchall()
-    ]
+    ]}
+
 
-    # 5. 高評価 Top 10
-    top_rated = [
+def _sec_top_rated(con) -> dict:
+    """5. 高評価 Top 10"""
+    return {"top_rated": [
         {"rank": i, "name": r[0], "type": r[1], "rating": r[2], "members": r[3]}
         for i, r in enumerate(con.execute("""
             SELECT name, type, rating, members FROM anime
             WHERE rating IS NOT NULL AND members >= 1000
             ORDER BY rating DESC LIMIT 10
         """).fetchall(), 1)
-    ]
+    ]}
 
-    # 6. 人気 Top 10（members）
-    top_popular = [
+
+def _sec_top_popular(con) -> dict:
+    """6. 人気 Top 10（members）"""
+    return {"top_popular": [
         {"rank": i, "name": r[0], "type": r[1], "rating": r[2], "members": r[3]}
         for i, r in enumerate(con.execute("""
             SELECT name, type, rating, members FROM anime
             ORDER BY members DESC LIMIT 10
         """).fetchall(), 1)
-    ]
+    ]}
+
 
-    # 7. ジャンル別統計 Top 20
-    genre_stats = [
+def _sec_genre_stats(con) -> dict:
+    """7. ジャンル別統計 Top 20（genre_id で整数結合・集計し、名前は最後の 20 件だけ引く）"""
+    return {"genre_stats": [
         {"genre": r[0], "count": r[1], "avg_rating": r[2],
          "avg_members": int(r[3]) if r[3] else None}
         for r in con.execute("""
-            WITH exploded AS (
-                SELECT TRIM(g.genre_val) AS genre, anime.rating, anime.members
-                FROM anime, UNNEST(str_split(anime.genre, ',')) AS g(genre_val)
-                WHERE anime.genre IS NOT NULL
+            WITH per_genre AS (
+                SELECT ag.genre_id, COUNT(*) AS n,
+                       AVG(a.rating) AS avg_rating, AVG(a.members) AS avg_members
+                FROM anime_genre ag JOIN anime a USING (anime_id)
+                GROUP BY ag.genre_id
+                ORDER BY n DESC LIMIT 20
             )
-            SELECT genre, COUNT(*), ROUND(AVG(rating),2), ROUND(AVG(members),0)
-            FROM exploded GROUP BY genre ORDER BY 2 DESC LIMIT 20
+            SELECT g.genre, p.n, ROUND(p.avg_rating,2), ROUND(p.avg_members,0)
+            FROM per_genre p JOIN genre g USING (genre_id)
+            ORDER BY p.n DESC
         """).fetchall()
-    ]
+    ]}
 
-    # 8. Rating ヒストグラム
+
+def _sec_rating_hist(con) -> dict:
+    """8. Rating ヒストグラム"""
     hist_raw = con.execute("""
         SELECT FLOOR(rating) AS bucket, COUNT(*) AS cnt
         FROM anime WHERE rating IS NOT NULL
         GROUP BY bucket ORDER BY bucket
     """).fetchall()
-    hist = [{"range": f"{int(r[0])}–{int(r[0])+1}", "count": r[1]} for r in hist_raw]
+    return {"rating_hist": [{"range": f"{int(r[0])}–{int(r[0])+1}", "count": r[1]}
+                            for r in hist_raw]}
+
 
-    # 9. 最長エピソード Top 10
-    longest = [
+def _sec_longest(con) -> dict:
+    """9. 最長エピソード Top 10"""
+    return {"longest": [
         {"name": r[0], "type": r[1], "episodes": r[2], "rating": r[3], "members": r[4]}
         for r in con.execute("""
             SELECT name, type, episodes, rating, members FROM anime
             WHERE episodes IS NOT NULL ORDER BY episodes DESC LIMIT 10
         """).fetchall()
-    ]
+    ]}
 
-    # 10. 相関: rating vs log10(members)
-    corr = con.execute("""
-        SELECT ROUND(CORR(rating, LOG(members)), 4)
-        FROM anime WHERE rating IS NOT NULL AND members > 0
-    """).fetchone()[0]
 
-    scatter_raw = con.execute("""
-        SELECT rating, members, name
+# 散布図の層化サンプリング（評価 × log10(members) の格子ごとに 1 点 + 全体で一様な間引き）
+SCATTER_POINTS = 2000   # 層化サンプルのおおよその点数（これに残差の大きい作品が加わる）
+SCATTER_BINS = 32       # 各軸の格子数（SCATTER_BINS² < SCATTER_POINTS であること）
+SCATTER_EXTREMES = 20   # 回帰残差の正・負それぞれで必ず残す件数
+SCATTER_SEED = 0
+
+
+def _sec_scatter(con) -> dict:
+    """10. 相関: rating vs log10(members) の散布図データ（決定的な層化サンプル）
+
+    評価 × log10(members) を SCATTER_BINS × SCATTER_BINS の格子に分け、空でない格子からは必ず 1 点
+    （hash が最小の作品）を残し、残りの枠は全体で一様な確率で配る（＝格子の件数に比例）。
+    乱数は hash(anime_id, SCATTER_SEED) なので同じ入力からは常に同じ点が選ばれ、キャッシュできる。
+    さらに回帰残差が最大・最小の SCATTER_EXTREMES 件ずつを必ず含める（疎な外れ値を落とさない）。
+    ウィンドウ関数を使わず集計と結合だけで済むので、入力が大きくてもソートは発生しない。
+    """
+    scatter_raw = con.execute(f"""
+    WITH base AS (
+        SELECT anime_id, name, rating, members, LOG10(members) AS log_m,
+               hash(anime_id, {SCATTER_SEED}) AS h
         FROM anime
         WHERE rating IS NOT NULL AND members > 0
-        USING SAMPLE 2000 ROWS
-        ORDER BY rating
+    ),
+    stats AS (
+        SELECT COUNT(*) AS n,
+               MIN(rating) AS r_lo, MAX(rating) - MIN(rating) AS r_span,
+               MIN(log_m) AS m_lo, MAX(log_m) - MIN(log_m) AS m_span,
+               REGR_INTERCEPT(log_m, rating) AS intercept, REGR_SLOPE(log_m, rating) AS slope
+        FROM base
+    ),
+    binned AS MATERIALIZED (
+        SELECT b.anime_id, b.name, b.rating, b.members, b.h, s.n,
+               b.log_m - (s.intercept + s.slope * b.rating) AS residual,
+               LEAST({SCATTER_BINS - 1}, COALESCE(
+                   FLOOR((b.rating - s.r_lo) / NULLIF(s.r_span, 0) * {SCATTER_BINS}), 0)) AS r_bin,
+               LEAST({SCATTER_BINS - 1}, COALESCE(
+                   FLOOR((b.log_m - s.m_lo) / NULLIF(s.m_span, 0) * {SCATTER_BINS}), 0)) AS m_bin
+        FROM base b, stats s
+    ),
+    cells AS (
+        SELECT r_bin, m_bin, min_by(anime_id, (h, anime_id)) AS first_id,
+               COUNT(*) OVER () AS occupied
+        FROM binned GROUP BY r_bin, m_bin
+    ),
+    kept AS (
+        SELECT anime_id FROM binned JOIN cells USING (r_bin, m_bin)
+        WHERE n <= {SCATTER_POINTS} OR anime_id = first_id
+           OR h % 1000003 < 1000003.0 * ({SCATTER_POINTS} - occupied) / n
+        UNION
+        (SELECT anime_id FROM binned WHERE residual IS NOT NULL
+         ORDER BY residual, anime_id LIMIT {SCATTER_EXTREMES})
+        UNION
+        (SELECT anime_id FROM binned WHERE residual IS NOT NULL
+         ORDER BY residual DESC, anime_id LIMIT {SCATTER_EXTREMES})
+    )
+    SELECT rating, members, name, n
+    FROM binned SEMI JOIN kept USING (anime_id)
+    ORDER BY rating, members, anime_id
     """).fetchall()
-    scatter_data = [{"x": r[0], "y": r[1], "label": r[2]} for r in scatter_raw]
-
-    # 回帰係数
-    reg = con.execute("""
-        SELECT
-            ROUND(REGR_SLOPE(LOG(members), rating), 4)     AS slope,
-            ROUND(REGR_INTERCEPT(LOG(members), rating), 4) AS intercept
-        FROM anime WHERE rating IS NOT NULL AND members > 0
-    """).fetchone()
-    reg_slope, reg_intercept = reg[0], reg[1]
+    return {"scatter_data": [{"x": r[0], "y": r[1], "label": r[2]} for r in scatter_raw],
+            "scatter_total": scatter_raw[0][3] if scatter_raw else 0}
 
-    # 回帰残差によるピックアップ（members ≥ 1000）
-    outliers = con.execute("""
+
+def _sec_outliers(con) -> dict:
+    """回帰残差によるピックアップ（members ≥ 1000）
+
+    各ピックアップの上位 5 件だけを DuckDB 側の Top-N（ORDER BY ... LIMIT）で取り出す。
+    """
+    picks = con.execute("""
     WITH base AS (
-        SELECT
-            name, type, rating, members,
-            LOG(members)  AS log_m,
-            REGR_INTERCEPT(LOG(members), rating) OVER () +
-            REGR_SLOPE(LOG(members), rating)     OVER () * rating AS pred_log_m
+        SELECT name, type, rating, members, LOG(members) AS log_m
         FROM anime
         WHERE rating IS NOT NULL AND members >= 1000
     ),
-    residuals AS (
-        SELECT *, ROUND(log_m - pred_log_m, 4) AS residual
+    -- 係数は 1 行の集計で求める（OVER () のウィンドウと違い全行を保持しない）
+    coef AS (
+        SELECT REGR_INTERCEPT(log_m, rating) AS intercept, REGR_SLOPE(log_m, rating) AS slope
         FROM base
+    ),
+    residuals AS (
+        SELECT name, type, rating, members,
+               ROUND(log_m - (intercept + slope * rating), 4) AS residual
+        FROM base, coef
+    ),
+    picks AS (
+        -- 残差が小さい＝相関に沿っている
+        (SELECT 1 AS pick, ABS(residual) AS sort_key, * FROM residuals
+         ORDER BY sort_key LIMIT 5)
+        UNION ALL
+        -- 残差が大きく負＝高評価なのに人気が低い（予想外れ）
+        (SELECT 2, residual, * FROM residuals ORDER BY residual LIMIT 5)
+        UNION ALL
+        -- 残差が大きく正＝評価の割に人気が高い（隠れた名作）
+        (SELECT 3, -residual, * FROM residuals ORDER BY residual DESC LIMIT 5)
     )
-    SELECT name, type, rating, members, residual,
-           ABS(residual) AS abs_res
-    FROM residuals
-    ORDER BY abs_res
+    SELECT pick, name, type, rating, members, residual
+    FROM picks ORDER BY pick, sort_key
     """).fetchall()
 
-    def _row(r):
-        return {"name": r[0], "type": r[1], "rating": r[2],
-                "members": r[3], "residual": r[4]}
-
-    # 残差が小さい＝相関に沖っている
-    conform = [_row(r) for r in outliers[:5]]
-    # 残差が大きく負＝高評価なのに人気が低い（預想外れ）
-    underperform = sorted([_row(r) for r in outliers], key=lambda x: x["residual"])[:5]
-    # 残差が大きく正＝評価の割に人気が高い（隠れた名作）
-    overperform  = sorted([_row(r) for r in outliers], key=lambda x: -x["residual"])[:5]
-
-    # 11. Special Pickups (Gemini AI)
-    gemini_pickups = [
-        {
-            "category": "知的好奇心を刺激する（あるいは物議を醸した）作品",
-            "items": [
-                ["Hametsu no Mars", "破滅のマルス", "「クソアニメ界の金字塔」としての圧倒的な知名度と、その酷さを確認したい好奇心。"],
-                ["Pupa", "pupa", "原作の期待値とアニメの完成度のギャップ、過度な規制による「伝説のがっかり感」。"],
-                ["Tenkuu Danzai Skelter+Heaven", "天空断罪スケルターヘヴン", "黎明期の拙い3DCGが醸し出すシュールさが、ネタとして愛でられているため。"],
-                ["Utsu Musume Sayuri", "打つ娘サユリ", "異質なビジュアルと生理的嫌悪感が、「検索してはいけない」系のミームとして定着。"],
-                ["Shitcom", "Shitcom", "あまりの不条理さと内容の無さに、困惑を共有したい視聴者が後を絶たない。"],
-            ]
-        },
-        {
-            "category": "高評価だが露出が少ない（データ上の隠れた名作）作品",
-            "items": [
-                ["Huyao Xiao Hongniang: Yue Hong", "縁結びの妖狐ちゃん（月紅篇）", "中国アニメという枠組みへの馴染みの薄さと、視聴者による非常に高い満足度。"],
-                ["Huyao Xiao Hongniang: Wangquan Fugui", "縁結びの妖狐ちゃん（王権富貴篇）", "同上。作品の質は保証されているものの、まだ広まりきっていない「至宝」。"],
-                ["Future GPX Cyber Formula Sin", "新世紀GPXサイバーフォーミュラSIN", "往年の名作の完結編。ファンのみが視聴するため高評価だが、登録数は限定的。"],
-                ["Madang-Eul Naon Amtalg", "庭を出た雌鶏", "韓国アニメ映画の傑作。深いテーマ性が高く評価されているが、露出が少ない。"],
-                ["Future GPX Cyber Formula Zero", "新世紀GPXサイバーフォーミュラZERO", "シリーズ途中からの視聴が難しいため、登録数は伸びにくいが、作品愛が非常に強い。"],
-            ]
-        }
-    ]
+    def _rows(pick):
+        return [{"name": r[1], "type": r[2], "rating": r[3],
+                 "members": r[4], "residual": r[5]}
+                for r in picks if r[0] == pick]
 
     return {
-        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "total_rows": total_rows,
-        "col_info": [{"column": c[0], "type": c[1]} for c in col_info],
-        "stats": {
-            "count": stats[0],
-            "rating":  {"mean": stats[1], "std": stats[2], "min": stats[3], "q1": stats[4],  "median": stats[5],  "q3": stats[6],  "max": stats[7]},
-            "members": {"mean": int(stats[8]), "min": int(stats[9]), "q1": int(stats[10]), "median": int(stats[11]), "q3": int(stats[12]), "max": int(stats[13])},
-            "episodes":{"mean": stats[14], "min": stats[15], "q1": stats[16], "median": stats[17], "q3": stats[18], "max": stats[19]},
-        },
-        "missing": missing,
-        "type_dist": type_dist,
-        "top_rated": top_rated,
-        "top_popular": top_popular,
-        "genre_stats": genre_stats,
-        "rating_hist": hist,
-        "longest": longest,
-        "rating_members_corr": corr,
-        "scatter_data": scatter_data,
-        "reg_slope": reg_slope,
-        "reg_intercept": reg_intercept,
-        "corr_conform": conform,
-        "corr_underperform": underperform,
-        "corr_overperform": overperform,
-        "gemini_pickups": gemini_pickups,
+        "corr_conform": _rows(1),
+        "corr_underperform": _rows(2),
+        "corr_overperform": _rows(3),
+    }
+
+
+# ── --ratings: rating ビューに対する集計（ユーザー × アニメの評価行列）
+
+# catalog_vs_users で平均ユーザー評価を比較するのに必要な最低評価件数
+CATALOG_MIN_RATINGS = 20
+
+_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+def _quantiles(values, digits: int) -> dict:
+    return {f"p{round(q * 100)}": round(v, digits) for q, v in zip(_QUANTILES, values)}
+
+
+def _log2_range(b: int) -> str:
+    lo, hi = 2 ** b, 2 ** (b + 1) - 1
+    return f"{lo:,}" if lo == hi else f"{lo:,}–{hi:,}"
+
+
+def _sec_rating_overview(con) -> dict:
+    """R1. 評価件数・ユーザー数・アニメ数・スパース性・スコア分布
+
+    ユーザー数・アニメ数は密度の分母になるので --approx でも厳密に数える
+    （R2 / R3 のキー単位の GROUP BY も厳密なので、近似してもメモリは減らない）。
+    """
+    r = con.execute("""
+    WITH by_score AS (
+        SELECT rating AS score, COUNT(*) AS n FROM rating GROUP BY rating
+    )
+    SELECT
+        COUNT(*), COUNT(DISTINCT user_id), COUNT(DISTINCT anime_id),
+        ROUND(AVG(rating), 3), ROUND(STDDEV_SAMP(rating), 3),
+        (SELECT list([score, n] ORDER BY score) FROM by_score)
+    FROM rating
+    """).fetchone()
+    n, users, anime = r[0], r[1], r[2]
+    density = n / (users * anime) if users and anime else 0.0
+    return {"rating_overview": {
+        "ratings": n, "users": users, "anime": anime,
+        "density": round(density, 6), "sparsity": round(1 - density, 6),
+        "mean": r[3], "std": r[4],
+        "score_hist": [{"score": s, "count": c} for s, c in r[5] or []],
+    }}
+
+
+def _activity(con, key: str) -> dict:
+    """key（user_id / anime_id）ごとの評価件数・平均・標準偏差の分布を 1 クエリで集計する
+
+    件数は 2 のべき乗幅のビンに数え、件数・平均・標準偏差の分位点と一緒に返す。
+    """
+    r = con.execute(f"""
+    WITH per_key AS MATERIALIZED (
+        SELECT {key}, COUNT(*) AS n, AVG(rating) AS mean, STDDEV_SAMP(rating) AS sd
+        FROM rating GROUP BY {key}
+    ),
+    count_bins AS (
+        SELECT FLOOR(LOG2(n))::INTEGER AS b, COUNT(*) AS c FROM per_key GROUP BY b
+    )
+    SELECT
+        COUNT(*),
+        (SELECT list([b, c] ORDER BY b) FROM count_bins),
+        stat_quantile(n, {_QUANTILES}), AVG(n), MAX(n), COUNT(*) FILTER (WHERE n = 1),
+        stat_quantile(mean, {_QUANTILES}), AVG(mean),
+        stat_quantile(sd, {_QUANTILES}), AVG(sd), COUNT(*) FILTER (WHERE sd = 0)
+    FROM per_key
+    """).fetchone()
+    return {
+        "entities": r[0],
+        "count_hist": [{"range": _log2_range(b), "count": c} for b, c in r[1] or []],
+        "count_quantiles": _quantiles(r[2] or [], 1),
+        "count_mean": round(r[3] or 0, 1), "count_max": r[4], "single": r[5],
+        "mean_quantiles": _quantiles(r[6] or [], 2),
+        "mean_mean": round(r[7] or 0, 3),
+        "std_quantiles": _quantiles(r[8] or [], 2),
+        "std_mean": round(r[9] or 0, 3), "std_zero": r[10],
     }
 
 
+def _sec_user_activity(con) -> dict:
+    """R2. ユーザーごとの評価件数・平均評価・標準偏差の分布"""
+    return {"user_activity": _activity(con, "user_id")}
+
+
+def _sec_anime_activity(con) -> dict:
+    """R3. アニメごとの評価件数・平均評価・標準偏差の分布"""
+    return {"anime_activity": _activity(con, "anime_id")}
+
+
+def _sec_catalog_vs_users(con) -> dict:
+    """R4. カタログの rating と、評価データから求めたアニメごとの平均ユーザー評価の比較
+
+    評価件数が CATALOG_MIN_RATINGS 未満のアニメは平均が不安定なので除く。
+    差（平均ユーザー評価 − カタログ評価）の大きい／小さい 5 件は max_by / min_by で取り出す。
+    """
+    r = con.execute(f"""
+    WITH per_anime AS (
+        SELECT anime_id, COUNT(*) AS n, AVG(rating) AS user_mean
+        FROM rating GROUP BY anime_id
+    ),
+    joined AS MATERIALIZED (
+        SELECT a.name, a.type, a.rating AS catalog, p.user_mean, p.n,
+               p.user_mean - a.rating AS gap
+        FROM per_anime p JOIN anime a USING (anime_id)
+        WHERE a.rating IS NOT NULL AND p.n >= {CATALOG_MIN_RATINGS}
+    )
+    SELECT
+        COUNT(*), ROUND(CORR(catalog, user_mean), 4),
+        ROUND(AVG(gap), 3), ROUND(AVG(ABS(gap)), 3),
+        max_by({{'name': name, 'type': type, 'catalog': catalog,
+                 'user_mean': ROUND(user_mean, 2), 'ratings': n, 'gap': ROUND(gap, 2)}}, gap, 5),
+        min_by({{'name': name, 'type': type, 'catalog': catalog,
+                 'user_mean': ROUND(user_mean, 2), 'ratings': n, 'gap': ROUND(gap, 2)}}, gap, 5)
+    FROM joined
+    """).fetchone()
+    return {"catalog_vs_users": {
+        "min_ratings": CATALOG_MIN_RATINGS,
+        "anime": r[0], "corr": r[1], "mean_gap": r[2], "mean_abs_gap": r[3],
+        "users_higher": r[4] or [], "users_lower": r[5] or [],
+    }}
+
+
+# セクション名 → クエリ関数（--profile の表示名にもなる）
+SECTIONS = {
+    "summary": _sec_summary,
+    "col_info": _sec_col_info,
+    "type_dist": _sec_type_dist,
+    "top_rated": _sec_top_rated,
+    "top_popular": _sec_top_popular,
+    "genre_stats": _sec_genre_stats,
+    "rating_hist": _sec_rating_hist,
+    "longest": _sec_longest,
+    "scatter": _sec_scatter,
+    "outliers": _sec_outliers,
+}
+
+# --ratings 指定時に追加で実行するセクション（rating ビューが必要）
+RATING_SECTIONS = {
+    "rating_overview": _sec_rating_overview,
+    "user_activity": _sec_user_activity,
+    "anime_activity": _sec_anime_activity,
+    "catalog_vs_users": _sec_catalog_vs_users,
+}
+
+# 11. Special Pickups (Gemini AI)
+GEMINI_PICKUPS = [
+    {
+        "category": "知的好奇心を刺激する（あるいは物議を醸した）作品",
+        "items": [
+            ["Hametsu no Mars", "破滅のマルス", "「クソアニメ界の金字塔」としての圧倒的な知名度と、その酷さを確認したい好奇心。"],
+            ["Pupa", "pupa", "原作の期待値とアニメの完成度のギャップ、過度な規制による「伝説のがっかり感」。"],
+            ["Tenkuu Danzai Skelter+Heaven", "天空断罪スケルターヘヴン", "黎明期の拙い3DCGが醸し出すシュールさが、ネタとして愛でられているため。"],
+            ["Utsu Musume Sayuri", "打つ娘サユリ", "異質なビジュアルと生理的嫌悪感が、「検索してはいけない」系のミームとして定着。"],
+            ["Shitcom", "Shitcom", "あまりの不条理さと内容の無さに、困惑を共有したい視聴者が後を絶たない。"],
+        ]
+    },
+    {
+        "category": "高評価だが露出が少ない（データ上の隠れた名作）作品",
+        "items": [
+            ["Huyao Xiao Hongniang: Yue Hong", "縁結びの妖狐ちゃん（月紅篇）", "中国アニメという枠組みへの馴染みの薄さと、視聴者による非常に高い満足度。"],
+            ["Huyao Xiao Hongniang: Wangquan Fugui", "縁結びの妖狐ちゃん（王権富貴篇）", "同上。作品の質は保証されているものの、まだ広まりきっていない「至宝」。"],
+            ["Future GPX Cyber Formula Sin", "新世紀GPXサイバーフォーミュラSIN", "往年の名作の完結編。ファンのみが視聴するため高評価だが、登録数は限定的。"],
+            ["Madang-Eul Naon Amtalg", "庭を出た雌鶏", "韓国アニメ映画の傑作。深いテーマ性が高く評価されているが、露出が少ない。"],
+            ["Future GPX Cyber Formula Zero", "新世紀GPXサイバーフォーミュラZERO", "シリーズ途中からの視聴が難しいため、登録数は伸びにくいが、作品愛が非常に強い。"],
+        ]
+    }
+]
+
+
+class QueryProfiler:
+    """fetch_data() の各セクションについて、実行時間・返却行数・DuckDB プロファイルを記録する
+
+    bind() が返すラッパー経由の execute() は結果を取得し終えるまでを計測し、
+    DuckDB のプロファイリング情報（EXPLAIN ANALYZE と同じオペレータツリー）をセクション名付きで残す。
+    クエリを再実行しないため、計測のためにレポート生成が遅くなることはない。
+    """
+
+    def __init__(self) -> None:
+        self.records: list[dict] = []
+
+    def bind(self, con: duckdb.DuckDBPyConnection, section: str) -> "_ProfiledConnection":
+        con.execute("PRAGMA enable_profiling = 'no_output'")
+        return _ProfiledConnection(self, con, section)
+
+
+class _FetchedResult:
+    """取得済みの行を DuckDB の結果と同じ fetchone()/fetchall()/description で返す"""
+
+    def __init__(self, rows: list, description) -> None:
+        self._rows = rows
+        self.description = description
+
+    def fetchall(self) -> list:
+        return self._rows
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+
+class _ProfiledConnection:
+    def __init__(self, profiler: QueryProfiler, con: duckdb.DuckDBPyConnection,
+                 section: str) -> None:
+        self._profiler = profiler
+        self._con = con
+        self._section = section
+
+    def execute(self, sql: str, *params) -> _FetchedResult:
+        t0 = time.perf_counter()
+        cur = self._con.execute(sql, *params)
+        rows = cur.fetchall()
+        seconds = time.perf_counter() - t0
+        profile = json.loads(self._con.get_profiling_information(format="json"))
+        self._profiler.records.append({
+            "section": self._section,
+            "seconds": round(seconds, 4),
+            "rows": len(rows),
+            "cpu_time": profile.get("cpu_time"),
+            "rows_scanned": profile.get("cumulative_rows_scanned"),
+            "profile": profile,
+        })
+        return _FetchedResult(rows, cur.description)
+
+
+def _run_section(con: duckdb.DuckDBPyConnection, name: str,
+                 profiler: QueryProfiler | None) -> dict:
+    section = SECTIONS.get(name) or RATING_SECTIONS[name]
+    return section(profiler.bind(con, name) if profiler else con)
+
+
+def _run_section_on_cursor(con: duckdb.DuckDBPyConnection, name: str,
+                           profiler: QueryProfiler | None) -> dict:
+    # カーソルは同じデータベースへの独立した接続なので、スレッドごとに 1 つ使う
+    cur = con.cursor()
+    try:
+        return _run_section(cur, name, profiler)
+    finally:
+        cur.close()
+
+
+def fetch_data(con: duckdb.DuckDBPyConnection, profiler: QueryProfiler | None = None,
+               workers: int = 1, ratings: bool = False) -> dict:
+    """全分析クエリを実行し、結果を dict にまとめて返す
+
+    workers > 1 の場合は独立した各セクションをスレッドプールで並行実行する
+    （DuckDB はクエリ実行中に GIL を解放する）。結果の dict は逐次実行時と同じ。
+    ratings=True の場合は rating ビュー（build_rating_view()）の集計セクションも実行する。
+    """
+    names = list(SECTIONS) + (list(RATING_SECTIONS) if ratings else [])
+    data = {"generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    if workers <= 1:
+        for name in names:
+            data.update(_run_section(con, name, profiler))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_run_section_on_cursor, con, name, profiler)
+                       for name in names]
+            for future in futures:
+                data.update(future.result())
+        if profiler:
+            # 完了順に積まれた記録をセクション定義順に並べ直す
+            order = {name: i for i, name in enumerate(names)}
+            profiler.records.sort(key=lambda r: order[r["section"]])
+    data["gemini_pickups"] = GEMINI_PICKUPS
+    return data
+
+
+def fetch_many(con: duckdb.DuckDBPyConnection, jobs: list[tuple[str, str | None]],
+               materialize: bool = False, approx: bool = False, workers: int = 1) -> list[dict]:
+    """複数のデータセット [(data_path, ratings_path), ...] を 1 本の接続で集計し、同じ順で返す
+
+    各データセットは専用のカーソルとスキーマ（dataset_<i>）でビュー・マクロを作るので、
+    anime / genre / rating などの名前が衝突しない。データセット単位で workers 並行に実行し、
+    各データセットのセクションは逐次実行する（カーソルを増やすとスキーマ設定が引き継がれないため）。
+    終わったデータセットのスキーマは破棄し、--materialize のテーブルもその時点で解放する。
+    """
+    def run(i: int, data_path: str, ratings_path: str | None) -> dict:
+        schema, alias = f"dataset_{i}", f"src_{i}"
+        cur = con.cursor()
+        try:
+            cur.execute(f"CREATE SCHEMA {schema}")
+            cur.execute(f"SET schema = '{schema}'")
+            build_view(cur, data_path, materialize=materialize, approx=approx, alias=alias)
+            if ratings_path:
+                build_rating_view(cur, data_path, ratings_path, alias)
+            return fetch_data(cur, ratings=ratings_path is not None)
+        finally:
+            cur.execute("SET schema = 'main'")
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            for db in (alias, f"rating_{alias}"):
+                cur.execute(f"DETACH DATABASE IF EXISTS {db}")
+            cur.close()
+
+    if workers <= 1:
+        return [run(i, *job) for i, job in enumerate(jobs)]
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run, i, *job) for i, job in enumerate(jobs)]
+        return [future.result() for future in futures]
+
+
+# ══════════════════════════════════════════════════════════
+# キャッシュ層 — fetch_data() の結果を入力ファイル単位で保存する
+# ══════════════════════════════════════════════════════════
+
+# fetch_data() のクエリや返す dict の形を変えたら上げる（古いキャッシュを無効化）
+CACHE_VERSION = 4
+
+
+def file_stamp(path) -> tuple[int, int] | None:
+    """ファイルの (サイズ, mtime_ns)。存在しなければ None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def cache_key(data_path: str, **options) -> str | None:
+    """入力ファイルのパス・サイズ・mtime とクエリセットのバージョンからキーを作る
+
+    組になるジャンル表（genre_table_files()）のサイズ・mtime も含め、作り直しや
+    追加・削除でジャンル統計のキャッシュが古いまま使われないようにする。
+    """
+    stamp = file_stamp(data_path)
+    if stamp is None:
+        return None
+    payload = json.dumps({
+        "path": str(Path(data_path).resolve()),
+        "size": stamp[0],
+        "mtime_ns": stamp[1],
+        "genre_tables": {n: file_stamp(f) for n, f in genre_table_files(data_path).items()},
+        "version": CACHE_VERSION,
+        **options,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load_cache(cache_dir: Path, key: str) -> dict | None:
+    """キャッシュ済みの fetch_data() 結果を返す（なければ None）"""
+    try:
+        return json.loads((cache_dir / f"{key}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def save_cache(cache_dir: Path, key: str, data: dict) -> None:
+    """fetch_data() の結果を書き込む（一時ファイル経由で置き換え、途中状態を残さない）"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_dir / f"{key}.json.tmp"
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, cache_dir / f"{key}.json")
+
+
 # ══════════════════════════════════════════════════════════
 # 出力層 A — Rich コンソール
 # ══════════════════════════════════════════════════════════
 
 def render_console(data: dict) -> None:
+    from rich import print as rprint
+    from rich.console import Console
+    from rich.table import Table
+
     console = Console()
 
     console.rule("[bold cyan]1. Dataset Overview")
@@ -286,7 +854,10 @@ def render_console(data: dict) -> None:
 
     console.rule("[bold cyan]2. Basic Statistics")
     s = data["stats"]
-    tbl = Table(title="Numeric Stats", header_style="bold blue")
+    if data.get("approx"):
+        rprint("  [yellow]≈ 分位点は近似値です（--approx: approx_quantile）[/yellow]")
+    tbl = Table(title="Numeric Stats" + (" (≈ approx.)" if data.get("approx") else ""),
+                header_style="bold blue")
     tbl.add_column("指標"); tbl.add_column("評価 (Rating)"); tbl.add_column("リスト登録数"); tbl.add_column("話数")
     tbl.add_row("mean",   str(s["rating"]["mean"]),   f"{s['members']['mean']:,}",   str(s["episodes"]["mean"]))
     tbl.add_row("std",    f"±{s['rating']['std']}",   "—",                           "—")
@@ -359,9 +930,94 @@ def render_console(data: dict) -> None:
     console.rule("[bold cyan]10. Correlation: Rating × Members")
     rprint(f"  Pearson correlation: [bold yellow]{data['rating_members_corr']}[/bold yellow]")
 
+    if "rating_overview" in data:
+        _render_console_ratings(console, data)
+
     console.rule("[bold green]EDA Complete ✓")
 
 
+def _render_console_ratings(console: Console, data: dict) -> None:
+    """--ratings のセクション（11〜14）"""
+    from rich import print as rprint
+    from rich.table import Table
+
+    o = data["rating_overview"]
+    approx = "≈ " if data.get("approx") else ""
+    console.rule("[bold cyan]11. Ratings Overview")
+    if approx:
+        rprint("  [yellow]≈ 分位点は近似値です（--approx）[/yellow]")
+    rprint(f"  Ratings : [bold]{o['ratings']:,}[/bold]   Users : [bold]{o['users']:,}[/bold]"
+           f"   Anime : [bold]{o['anime']:,}[/bold]")
+    rprint(f"  Density : [bold]{o['density']:.4%}[/bold]   Sparsity : [bold]{o['sparsity']:.4%}[/bold]")
+    rprint(f"  Mean score : [bold]{o['mean']}[/bold] ± {o['std']}")
+    tbl = Table(title="Score Histogram", header_style="bold white")
+    tbl.add_column("Score"); tbl.add_column("Count"); tbl.add_column("Bar")
+    max_cnt = max((h["count"] for h in o["score_hist"]), default=1)
+    for h in o["score_hist"]:
+        tbl.add_row(str(h["score"]), f"{h['count']:,}", "█" * int(h["count"] / max_cnt * 40))
+    console.print(tbl)
+
+    for num, key, label, plural in [(12, "user_activity", "User", "Users"),
+                                    (13, "anime_activity", "Anime", "Anime")]:
+        a = data[key]
+        console.rule(f"[bold cyan]{num}. Ratings per {label}")
+        rprint(f"  {plural} : [bold]{a['entities']:,}[/bold]   mean ratings : [bold]{a['count_mean']}[/bold]"
+               f"   max : {a['count_max']:,}   with 1 rating : {a['single']:,}")
+        rprint(f"  std of scores = 0 : {a['std_zero']:,}   mean std : {a['std_mean']}")
+        tbl = Table(title=f"{approx}Per-{label} Quantiles", header_style="bold blue")
+        tbl.add_column("指標")
+        for q in a["count_quantiles"]:
+            tbl.add_column(q)
+        for name, qs in [("# ratings", a["count_quantiles"]),
+                         ("mean score", a["mean_quantiles"]),
+                         ("std score", a["std_quantiles"])]:
+            tbl.add_row(name, *[str(v) for v in qs.values()])
+        console.print(tbl)
+        tbl = Table(title=f"Ratings per {label}", header_style="bold white")
+        tbl.add_column("# ratings"); tbl.add_column(plural); tbl.add_column("Bar")
+        max_cnt = max((h["count"] for h in a["count_hist"]), default=1)
+        for h in a["count_hist"]:
+            tbl.add_row(h["range"], f"{h['count']:,}", "█" * int(h["count"] / max_cnt * 40))
+        console.print(tbl)
+
+    c = data["catalog_vs_users"]
+    console.rule("[bold cyan]14. Catalog Rating × Mean User Rating")
+    rprint(f"  Anime with ≥ {c['min_ratings']} ratings : [bold]{c['anime']:,}[/bold]")
+    rprint(f"  Pearson correlation: [bold yellow]{c['corr']}[/bold yellow]"
+           f"   mean gap : {c['mean_gap']:+}   mean |gap| : {c['mean_abs_gap']}")
+    for title, rows in [("Users rate higher than catalog", c["users_higher"]),
+                        ("Users rate lower than catalog", c["users_lower"])]:
+        tbl = Table(title=title, header_style="bold magenta")
+        for col in ["Name", "Type", "Catalog", "User Mean", "Ratings", "Gap"]:
+            tbl.add_column(col)
+        for r in rows:
+            tbl.add_row(r["name"], str(r["type"]), str(r["catalog"]), str(r["user_mean"]),
+                        f"{r['ratings']:,}", f"{r['gap']:+}")
+        console.print(tbl)
+
+
+def render_profile(records: list[dict]) -> None:
+    """--profile: セクションごとの計測結果を標準エラーへ表で出す"""
+    from rich.console import Console
+    from rich.table import Table
+
+    console = Console(stderr=True)
+    total = sum(r["seconds"] for r in records) or 1
+    tbl = Table(title="fetch_data() profile", header_style="bold cyan")
+    for col in ["Section", "Wall (ms)", "Share", "CPU (ms)", "Rows", "Rows scanned"]:
+        tbl.add_column(col, justify="left" if col == "Section" else "right")
+    for r in records:
+        cpu = r["cpu_time"]
+        tbl.add_row(
+            r["section"], f"{r['seconds'] * 1000:,.1f}", f"{r['seconds'] / total:.0%}",
+            f"{cpu * 1000:,.1f}" if cpu is not None else "—",
+            f"{r['rows']:,}", f"{r['rows_scanned']:,}" if r["rows_scanned"] is not None else "—",
+        )
+    # --workers で並行実行した場合は各セクションが重なるため、合計は経過時間ではない
+    tbl.add_row("[bold]sum", f"[bold]{total * 1000:,.1f}", "", "", "", "")
+    console.print(tbl)
+
+
 # ══════════════════════════════════════════════════════════
 # 出力層 B — HTML レポート
 # ══════════════════════════════════════════════════════════
@@ -369,13 +1025,14 @@ def render_console(data: dict) -> None:
 def _html_table(headers: list[str], rows: list[list], highlight_col: int | None = None) -> str:
     """ヘッダーと行データから HTML <table> を生成する"""
     ths = "".join(f"<th>{h}</th>" for h in headers)
-    trs = ""
-    for row in rows:
-        tds = ""
-        for i, cell in enumerate(row):
-            cls = ' class="highlight"' if i == highlight_col else ""
-            tds += f"<td{cls}>{cell}</td>"
-        trs += f"<tr>{tds}</tr>"
+    hl = ' class="highlight"'
+    trs = "".join(
+        "<tr>" + "".join(
+            f"<td{hl if i == highlight_col else ''}>{cell}</td>"
+            for i, cell in enumerate(row)
+        ) + "</tr>"
+        for row in rows
+    )
     return f"<table><thead><tr>{ths}</tr></thead><tbody>{trs}</tbody></table>"
 
 
@@ -390,8 +1047,160 @@ def _bar(count: int, max_count: int, total: int, width: int = 200) -> str:
     )
 
 
-def render_html(data: dict, output_path: Path) -> None:
+def _ratings_html(data: dict) -> str:
+    """--ratings のセクション（10. 評価データ）"""
+    o = data["rating_overview"]
+    approx = "≈ " if data.get("approx") else ""
+    cards = f"""
+    <div class="cards">
+      <div class="card"><div class="card-value">{o['ratings']:,}</div><div class="card-label">評価件数</div></div>
+      <div class="card"><div class="card-value">{o['users']:,}</div><div class="card-label">ユーザー数</div></div>
+      <div class="card"><div class="card-value">{o['anime']:,}</div><div class="card-label">評価されたアニメ数</div></div>
+      <div class="card"><div class="card-value">{o['sparsity']:.2%}</div><div class="card-label">スパース率（評価行列の空き）</div></div>
+      <div class="card"><div class="card-value">{o['mean']}</div><div class="card-label">平均ユーザー評価 (±{o['std']})</div></div>
+    </div>"""
+
+    def _hist_table(label: str, hist: list[dict], key: str) -> str:
+        total = sum(h["count"] for h in hist) or 1
+        max_cnt = max((h["count"] for h in hist), default=1)
+        return _html_table([label, "件数", "分布"],
+                           [[h[key], f"{h['count']:,}", _bar(h["count"], max_cnt, total)]
+                            for h in hist])
+
+    parts = [cards, '<h3 style="font-size:.95rem;margin:1rem 0 .5rem">スコア分布</h3>',
+             _hist_table("スコア", o["score_hist"], "score")]
+    for key, label in [("user_activity", "ユーザー"), ("anime_activity", "アニメ")]:
+        a = data[key]
+        quantile_table = _html_table(
+            ["指標", *a["count_quantiles"], "平均"],
+            [["評価件数", *a["count_quantiles"].values(), a["count_mean"]],
+             ["平均評価", *a["mean_quantiles"].values(), a["mean_mean"]],
+             ["評価の標準偏差", *a["std_quantiles"].values(), a["std_mean"]]],
+        )
+        parts.append(
+            f'<h3 style="font-size:.95rem;margin:2rem 0 .5rem">{label}ごとの評価件数・平均・標準偏差'
+            f'{"（分位点は近似値）" if approx else ""}</h3>'
+            f'<p style="font-size:.8rem;color:var(--muted);margin-bottom:.75rem">'
+            f'{label}数 {a["entities"]:,} ／ 最大 {a["count_max"]:,} 件 ／ 1 件のみ {a["single"]:,} ／ '
+            f'標準偏差 0（全て同じスコア） {a["std_zero"]:,}</p>'
+        )
+        parts.append(quantile_table)
+        parts.append(_hist_table("評価件数", a["count_hist"], "range"))
+
+    c = data["catalog_vs_users"]
+    parts.append(
+        f'<h3 style="font-size:.95rem;margin:2rem 0 .5rem">カタログ評価 × 平均ユーザー評価</h3>'
+        f'<p style="font-size:.8rem;color:var(--muted);margin-bottom:.75rem">'
+        f'評価 {c["min_ratings"]} 件以上のアニメ {c["anime"]:,} 件 ／ ピアソン相関 '
+        f'<strong style="color:var(--accent2)">{c["corr"]}</strong> ／ 平均差 {c["mean_gap"]:+} ／ '
+        f'平均絶対差 {c["mean_abs_gap"]}（差 = 平均ユーザー評価 − カタログ評価）</p>'
+    )
+    headers = ["タイトル", "タイプ", "カタログ評価", "平均ユーザー評価", "評価件数", "差"]
+    for title, rows in [("ユーザー評価の方が高い", c["users_higher"]),
+                        ("ユーザー評価の方が低い", c["users_lower"])]:
+        parts.append(f'<h3 style="font-size:.9rem;color:var(--muted);margin:1rem 0 .5rem">{title}</h3>')
+        parts.append(_html_table(
+            headers,
+            [[r["name"], r["type"], r["catalog"], r["user_mean"], f"{r['ratings']:,}",
+              f"{r['gap']:+}"] for r in rows],
+            highlight_col=5,
+        ))
+    body = "\n    ".join(parts)
+    return f"""  <section>
+    <h2>10. 評価データ（ユーザー × アニメ）</h2>
+    {body}
+  </section>
+
+"""
+
+
+# HTML レポートと index.html で共有するスタイル
+REPORT_CSS = """    :root {
+      --bg: #0f1117; --surface: #1a1d27; --surface2: #22263a;
+      --accent: #7c6af7; --accent2: #56cfe1; --text: #e2e8f0;
+      --muted: #8892b0; --ok: #4ade80; --warn: #f59e0b;
+      --border: #2d3154;
+    }
+    * { box-sizing: border-box; margin: 0; padding: 0; }
+    body { background: var(--bg); color: var(--text); font-family: 'Segoe UI', system-ui, sans-serif; padding: 2rem; }
+    h1 { font-size: 2rem; background: linear-gradient(90deg,var(--accent),var(--accent2)); -webkit-background-clip:text; -webkit-text-fill-color:transparent; margin-bottom:.25rem; }
+    .meta { color: var(--muted); font-size:.85rem; margin-bottom:2rem; }
+    .cards { display:grid; grid-template-columns:repeat(auto-fit,minmax(160px,1fr)); gap:1rem; margin-bottom:2.5rem; }
+    .card { background:var(--surface); border:1px solid var(--border); border-radius:12px; padding:1.25rem; text-align:center; }
+    .card-value { font-size:1.8rem; font-weight:700; color:var(--accent2); }
+    .card-label { font-size:.8rem; color:var(--muted); margin-top:.25rem; }
+    section { margin-bottom:3rem; }
+    h2 { font-size:1.1rem; font-weight:600; color:var(--accent); margin-bottom:1rem; border-left:3px solid var(--accent); padding-left:.75rem; }
+    table { width:100%; border-collapse:collapse; background:var(--surface); border-radius:10px; overflow:hidden; }
+    th { background:var(--surface2); color:var(--accent2); font-size:.8rem; text-transform:uppercase; letter-spacing:.05em; padding:.75rem 1rem; text-align:left; }
+    td { padding:.65rem 1rem; border-top:1px solid var(--border); font-size:.9rem; color:var(--text); }
+    td.highlight { color:var(--accent2); font-weight:600; }
+    tr:hover td { background:var(--surface2); }
+    .badge { display:inline-block; padding:.2em .6em; border-radius:999px; font-size:.8rem; font-weight:600; }
+    .badge-ok   { background:#14532d44; color:var(--ok); }
+    .badge-warn { background:#78350f44; color:var(--warn); }
+    .charts { display:grid; grid-template-columns:repeat(auto-fit,minmax(320px,1fr)); gap:1.5rem; margin-bottom:2.5rem; }
+    .chart-box { background:var(--surface); border:1px solid var(--border); border-radius:12px; padding:1.25rem; }
+    .chart-box h3 { font-size:.9rem; color:var(--muted); margin-bottom:1rem; }
+    .bar-wrap { display:flex; align-items:center; gap:.5rem; }
+    .bar { height:16px; background:linear-gradient(90deg,var(--accent),var(--accent2)); border-radius:4px; }
+    .bar-wrap span { font-size:.78rem; color:var(--muted); white-space:nowrap; }
+    footer { text-align:center; color:var(--muted); font-size:.8rem; margin-top:3rem; }
+"""
+
+
+# 散布図の x（rating, 小数 2 桁）は SCATTER_X_SCALE 倍した整数で埋め込む
+SCATTER_X_SCALE = 100
+
+
+def _scatter_columns(points: list[dict]) -> dict:
+    """散布図の点 [{x, y, label}, ...] を列指向の配列に変換する
+
+    名前は出現順の辞書 names に 1 回だけ入れ、各点は names の添字を持つ。
+    ブラウザ側の expandScatter() が Chart.js 用の点オブジェクトに戻す。
+    """
+    names: dict[str, int] = {}
+    labels = [names.setdefault(p["label"], len(names)) for p in points]
+    return {
+        "scale": SCATTER_X_SCALE,
+        "x": [round(p["x"] * SCATTER_X_SCALE) for p in points],
+        "y": [p["y"] for p in points],
+        "label": labels,
+        "names": list(names),
+    }
+
+
+def _gzip_base64(chunks):
+    """文字列チャンクを gzip 圧縮し、base64 の文字列チャンクとして順に返す
+
+    base64 は 3 バイト単位でしか区切れないので、端数は次のチャンクへ持ち越す。
+    gzip ヘッダの mtime は 0 になるため、同じ入力からは同じ出力が得られる。
+    """
+    gz = zlib.compressobj(9, zlib.DEFLATED, 31)
+    pending = b""
+    for chunk in chunks:
+        pending += gz.compress(chunk.encode("utf-8"))
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut]).decode("ascii")
+            pending = pending[cut:]
+    yield base64.b64encode(pending + gz.flush()).decode("ascii")
+
+
+def iter_html(data: dict, compress: bool = False, source: str | None = None):
+    """HTML レポートを先頭からセクション単位の文字列として順に yield する
+
+    文書全体を 1 つの巨大な文字列として組み立てず、呼び出し側がファイル等へ逐次書き出せる。
+    compress=True ではグラフ用の埋め込みデータを gzip + base64 にし、
+    ブラウザの DecompressionStream で展開する。
+    source は集計した入力（--data のパス）で、ヘッダーの「データ:」に表示する。
+    """
+    from html import escape
+
     s = data["stats"]
+    source_meta = f" &nbsp;|&nbsp; データ: {escape(source)}" if source else ""
+    approx_badge = (' <span class="badge badge-warn" title="--approx: スケッチによる近似値">≈ 近似値</span>'
+                    if data.get("approx") else "")
 
     # ── セクション1: Overview カード
     cards_html = f"""
@@ -475,19 +1284,19 @@ def render_html(data: dict, output_path: Path) -> None:
         return _html_table(headers, rows, highlight_col=highlight_col)
 
     # ── JSON data (埋め込み用)
-    data_json = json.dumps({
+    payload = {
         "labels": [h["range"] for h in data["rating_hist"]],
         "counts": [h["count"] for h in data["rating_hist"]],
         "genres": [g["genre"] for g in data["genre_stats"]],
         "genre_counts": [g["count"] for g in data["genre_stats"]],
         "types": [t["type"] for t in data["type_dist"] if t["type"]],
         "type_counts": [t["count"] for t in data["type_dist"] if t["type"]],
-        "scatter": data["scatter_data"],
+        "scatter": _scatter_columns(data["scatter_data"]),
         "reg_slope": data["reg_slope"],
         "reg_intercept": data["reg_intercept"],
-    }, ensure_ascii=False)
+    }
 
-    html = f"""<!DOCTYPE html>
+    yield f"""<!DOCTYPE html>
 <html lang="ja">
 <head>
   <meta charset="UTF-8">
@@ -495,47 +1304,17 @@ def render_html(data: dict, output_path: Path) -> None:
   <title>アニメデータセット EDA レポート</title>
   <script src="https://cdn.jsdelivr.net/npm/chart.js@4"></script>
   <style>
-    :root {{
-      --bg: #0f1117; --surface: #1a1d27; --surface2: #22263a;
-      --accent: #7c6af7; --accent2: #56cfe1; --text: #e2e8f0;
-      --muted: #8892b0; --ok: #4ade80; --warn: #f59e0b;
-      --border: #2d3154;
-    }}
-    * {{ box-sizing: border-box; margin: 0; padding: 0; }}
-    body {{ background: var(--bg); color: var(--text); font-family: 'Segoe UI', system-ui, sans-serif; padding: 2rem; }}
-    h1 {{ font-size: 2rem; background: linear-gradient(90deg,var(--accent),var(--accent2)); -webkit-background-clip:text; -webkit-text-fill-color:transparent; margin-bottom:.25rem; }}
-    .meta {{ color: var(--muted); font-size:.85rem; margin-bottom:2rem; }}
-    .cards {{ display:grid; grid-template-columns:repeat(auto-fit,minmax(160px,1fr)); gap:1rem; margin-bottom:2.5rem; }}
-    .card {{ background:var(--surface); border:1px solid var(--border); border-radius:12px; padding:1.25rem; text-align:center; }}
-    .card-value {{ font-size:1.8rem; font-weight:700; color:var(--accent2); }}
-    .card-label {{ font-size:.8rem; color:var(--muted); margin-top:.25rem; }}
-    section {{ margin-bottom:3rem; }}
-    h2 {{ font-size:1.1rem; font-weight:600; color:var(--accent); margin-bottom:1rem; border-left:3px solid var(--accent); padding-left:.75rem; }}
-    table {{ width:100%; border-collapse:collapse; background:var(--surface); border-radius:10px; overflow:hidden; }}
-    th {{ background:var(--surface2); color:var(--accent2); font-size:.8rem; text-transform:uppercase; letter-spacing:.05em; padding:.75rem 1rem; text-align:left; }}
-    td {{ padding:.65rem 1rem; border-top:1px solid var(--border); font-size:.9rem; color:var(--text); }}
-    td.highlight {{ color:var(--accent2); font-weight:600; }}
-    tr:hover td {{ background:var(--surface2); }}
-    .badge {{ display:inline-block; padding:.2em .6em; border-radius:999px; font-size:.8rem; font-weight:600; }}
-    .badge-ok   {{ background:#14532d44; color:var(--ok); }}
-    .badge-warn {{ background:#78350f44; color:var(--warn); }}
-    .charts {{ display:grid; grid-template-columns:repeat(auto-fit,minmax(320px,1fr)); gap:1.5rem; margin-bottom:2.5rem; }}
-    .chart-box {{ background:var(--surface); border:1px solid var(--border); border-radius:12px; padding:1.25rem; }}
-    .chart-box h3 {{ font-size:.9rem; color:var(--muted); margin-bottom:1rem; }}
-    .bar-wrap {{ display:flex; align-items:center; gap:.5rem; }}
-    .bar {{ height:16px; background:linear-gradient(90deg,var(--accent),var(--accent2)); border-radius:4px; }}
-    .bar-wrap span {{ font-size:.78rem; color:var(--muted); white-space:nowrap; }}
-    footer {{ text-align:center; color:var(--muted); font-size:.8rem; margin-top:3rem; }}
-  </style>
+{REPORT_CSS}  </style>
 </head>
 <body>
   <h1>🎌 アニメデータセット EDA レポート</h1>
   <p class="meta">
-    生成日時: {data['generated_at']} &nbsp;|&nbsp; データ: data/processed/anime_processed.csv<br>
+    生成日時: {data['generated_at']}{source_meta}<br>
     出典: <a href="https://www.kaggle.com/datasets/CooperUnion/anime-recommendations-database" target="_blank" rel="noopener noreferrer" style="color:var(--accent2);text-decoration:none;">MyAnimeList Dataset (Kaggle)</a>
   </p>
 
-  {cards_html}
+"""
+    yield f"""  {cards_html}
 
   <div class="charts">
     <div class="chart-box"><h3>評価スコア分布</h3><canvas id="histChart"></canvas></div>
@@ -543,18 +1322,21 @@ def render_html(data: dict, output_path: Path) -> None:
     <div class="chart-box" style="grid-column:1/-1"><h3>ジャンル別件数 TOP 20</h3><canvas id="genreChart"></canvas></div>
   </div>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>1. カラム情報</h2>
     {col_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>2. 欠損値</h2>
     {missing_table}
   </section>
 
-  <section>
-    <h2>3. 基本統計量</h2>
+"""
+    yield f"""  <section>
+    <h2>3. 基本統計量{approx_badge}</h2>
     <table><thead><tr><th>指標</th><th>評価 (Rating)</th><th>リスト登録数</th><th>話数</th></tr></thead><tbody>
       <tr><td>平均</td>   <td class="highlight">{s['rating']['mean']}</td><td class="highlight">{s['members']['mean']:,}</td><td class="highlight">{s['episodes']['mean']}</td></tr>
       <tr><td>標準偏差</td><td>±{s['rating']['std']}</td><td>—</td><td>—</td></tr>
@@ -566,36 +1348,42 @@ def render_html(data: dict, output_path: Path) -> None:
     </tbody></table>
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>4. タイプ別分布</h2>
     {type_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>5. 高評価アニメ TOP 10</h2>
     {rated_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>6. 人気アニメ TOP 10（リスト登録数順）</h2>
     {pop_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>7. 話数が多いアニメ TOP 10</h2>
     {long_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>8. ジャンル別統計 TOP 20</h2>
     {genre_table}
   </section>
 
-  <section>
+"""
+    yield f"""  <section>
     <h2>9. 評価 × 登録数 の相関と特筆すべき作品 (AI Pickups)</h2>
     <div style="display:grid;grid-template-columns:1fr 260px;gap:1.5rem;align-items:start">
       <div style="background:var(--surface);border:1px solid var(--border);border-radius:12px;padding:1.25rem">
-        <p style="font-size:.85rem;color:var(--muted);margin-bottom:.5rem">散布図（最大20,000件サンプル）／Y軸は対数スケール</p>
+        <p style="font-size:.85rem;color:var(--muted);margin-bottom:.5rem">散布図（全 {data['scatter_total']:,} 件から {len(data['scatter_data']):,} 件を層化サンプル）／Y軸は対数スケール</p>
         <p style="font-size:.82rem;font-family:monospace;color:var(--accent2);margin-bottom:.75rem">
           log₁₀(リスト登録数) = {data['reg_slope']:+} × 評価 + {data['reg_intercept']}
         </p>
@@ -631,108 +1419,412 @@ def render_html(data: dict, output_path: Path) -> None:
     </div>
   </section>
 
-  <script>
-  const d = {data_json};
-  const chartDefaults = {{
-    plugins: {{ legend: {{ labels: {{ color: '#e2e8f0' }} }} }},
-    scales: {{
-      x: {{ ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }} }},
-      y: {{ ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }} }}
-    }}
-  }};
-  new Chart(document.getElementById('histChart'), {{
-    type: 'bar',
-    data: {{ labels: d.labels, datasets: [{{
-      label: '件数',
-      data: d.counts,
-      backgroundColor: 'rgba(124,106,247,0.7)',
-      borderColor: '#7c6af7', borderWidth: 1, borderRadius: 4
-    }}] }},
-    options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
-  }});
-  new Chart(document.getElementById('typeChart'), {{
-    type: 'bar',
-    data: {{ labels: d.types, datasets: [{{
-      label: '# Anime',
-      data: d.type_counts,
-      backgroundColor: ['#7c6af7','#56cfe1','#4ade80','#f59e0b','#f87171','#a78bfa'],
-      borderRadius: 4
-    }}] }},
-    options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
-  }});
-  new Chart(document.getElementById('genreChart'), {{
-    type: 'bar',
-    data: {{ labels: d.genres, datasets: [{{
-      label: '# Anime',
-      data: d.genre_counts,
-      backgroundColor: 'rgba(86,207,225,0.7)',
-      borderColor: '#56cfe1', borderWidth: 1, borderRadius: 4
-    }}] }},
-    options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
-  }});
-  new Chart(document.getElementById('scatterChart'), {{
-    type: 'scatter',
-    data: {{ datasets: [
-      {{
-        label: 'アニメ',
-        data: d.scatter,
-        backgroundColor: 'rgba(124,106,247,0.35)',
-        borderColor: 'rgba(124,106,247,0.7)',
-        borderWidth: 0.5,
-        pointRadius: 3,
-        pointHoverRadius: 6,
-      }},
-      {{
-        label: '回帰直線',
-        data: Array.from({{length: 37}}, (_, i) => {{
-          const x = 1 + i * 0.25;
-          return {{ x, y: Math.pow(10, d.reg_slope * x + d.reg_intercept) }};
-        }}),
-        type: 'line',
-        borderColor: '#f59e0b',
-        borderWidth: 2,
-        borderDash: [6, 3],
-        pointRadius: 0,
-        tension: 0,
-        fill: false,
+"""
+    if "rating_overview" in data:
+        yield _ratings_html(data)
+    yield f"""  <script>
+  // 埋め込みデータの散布図（列指向・名前は辞書化）を Chart.js の点オブジェクトに戻す
+  function expandScatter(s) {{
+    return s.x.map((x, i) => ({{ x: x / s.scale, y: s.y[i], label: s.names[s.label[i]] }}));
+  }}
+  async function unpackPayload(b64) {{
+    const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0));
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'));
+    return JSON.parse(await new Response(stream).text());
+  }}
+  function drawCharts(d) {{
+    const chartDefaults = {{
+      plugins: {{ legend: {{ labels: {{ color: '#e2e8f0' }} }} }},
+      scales: {{
+        x: {{ ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }} }},
+        y: {{ ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }} }}
       }}
-    ] }},
-    options: {{
-      plugins: {{
-        legend: {{ display: false }},
-        tooltip: {{
-          filter: item => item.datasetIndex === 0,
-          callbacks: {{
-            label: ctx => `${{ctx.raw.label}} (評価: ${{ctx.raw.x}}, リスト登録数: ${{ctx.raw.y.toLocaleString()}})`
-          }}
+    }};
+    new Chart(document.getElementById('histChart'), {{
+      type: 'bar',
+      data: {{ labels: d.labels, datasets: [{{
+        label: '件数',
+        data: d.counts,
+        backgroundColor: 'rgba(124,106,247,0.7)',
+        borderColor: '#7c6af7', borderWidth: 1, borderRadius: 4
+      }}] }},
+      options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
+    }});
+    new Chart(document.getElementById('typeChart'), {{
+      type: 'bar',
+      data: {{ labels: d.types, datasets: [{{
+        label: '# Anime',
+        data: d.type_counts,
+        backgroundColor: ['#7c6af7','#56cfe1','#4ade80','#f59e0b','#f87171','#a78bfa'],
+        borderRadius: 4
+      }}] }},
+      options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
+    }});
+    new Chart(document.getElementById('genreChart'), {{
+      type: 'bar',
+      data: {{ labels: d.genres, datasets: [{{
+        label: '# Anime',
+        data: d.genre_counts,
+        backgroundColor: 'rgba(86,207,225,0.7)',
+        borderColor: '#56cfe1', borderWidth: 1, borderRadius: 4
+      }}] }},
+      options: {{ ...chartDefaults, indexAxis: 'y', plugins: {{ ...chartDefaults.plugins, legend: {{ display: false }} }} }}
+    }});
+    new Chart(document.getElementById('scatterChart'), {{
+      type: 'scatter',
+      data: {{ datasets: [
+        {{
+          label: 'アニメ',
+          data: expandScatter(d.scatter),
+          backgroundColor: 'rgba(124,106,247,0.35)',
+          borderColor: 'rgba(124,106,247,0.7)',
+          borderWidth: 0.5,
+          pointRadius: 3,
+          pointHoverRadius: 6,
+        }},
+        {{
+          label: '回帰直線',
+          data: Array.from({{length: 37}}, (_, i) => {{
+            const x = 1 + i * 0.25;
+            return {{ x, y: Math.pow(10, d.reg_slope * x + d.reg_intercept) }};
+          }}),
+          type: 'line',
+          borderColor: '#f59e0b',
+          borderWidth: 2,
+          borderDash: [6, 3],
+          pointRadius: 0,
+          tension: 0,
+          fill: false,
         }}
-      }},
-      scales: {{
-        x: {{
-          title: {{ display: true, text: '評価スコア', color: '#8892b0' }},
-          ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }},
-          min: 1, max: 10
+      ] }},
+      options: {{
+        plugins: {{
+          legend: {{ display: false }},
+          tooltip: {{
+            filter: item => item.datasetIndex === 0,
+            callbacks: {{
+              label: ctx => `${{ctx.raw.label}} (評価: ${{ctx.raw.x}}, リスト登録数: ${{ctx.raw.y.toLocaleString()}})`
+            }}
+          }}
         }},
-        y: {{
-          type: 'logarithmic',
-          title: {{ display: true, text: 'リスト登録数（対数）', color: '#8892b0' }},
-          ticks: {{ color: '#8892b0', callback: v => v >= 1000 ? (v/1000).toFixed(0)+'K' : v }},
-          grid: {{ color: '#2d3154' }}
+        scales: {{
+          x: {{
+            title: {{ display: true, text: '評価スコア', color: '#8892b0' }},
+            ticks: {{ color: '#8892b0' }}, grid: {{ color: '#2d3154' }},
+            min: 1, max: 10
+          }},
+          y: {{
+            type: 'logarithmic',
+            title: {{ display: true, text: 'リスト登録数（対数）', color: '#8892b0' }},
+            ticks: {{ color: '#8892b0', callback: v => v >= 1000 ? (v/1000).toFixed(0)+'K' : v }},
+            grid: {{ color: '#2d3154' }}
+          }}
         }}
       }}
-    }}
-  }});
-  </script>
+    }});
+  }}
+"""
+    # 散布図など大きくなりうる埋め込みデータはエンコードしながら書き出す
+    chunks = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).iterencode(payload)
+    if compress:
+        yield '  unpackPayload("'
+        yield from _gzip_base64(chunks)
+        yield '").then(drawCharts);\n'
+    else:
+        yield "  drawCharts("
+        yield from chunks
+        yield ");\n"
+    yield """  </script>
 </body>
 </html>"""
 
-    output_path.write_text(html, encoding="utf-8")
+
+def write_html(data: dict, fp, compress: bool = False, source: str | None = None) -> None:
+    """HTML レポートをファイルハンドル（テキストモード）へストリーミングで書き出す"""
+    for chunk in iter_html(data, compress, source):
+        fp.write(chunk)
+
+
+def render_html(data: dict, output_path: Path, compress: bool = False,
+                source: str | None = None) -> None:
+    """HTML レポートを一時ファイルへ書き出してから output_path に置き換える"""
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fp:
+        write_html(data, fp, compress, source)
+    os.replace(tmp, output_path)
+
+
+def render_index(entries: list[dict], output_path: Path) -> None:
+    """複数データセットのレポートへのリンクを並べた index.html を書き出す
+
+    entries は {"name", "path", "report"（index.html からの相対パス）, "data"} の dict のリスト。
+    """
+    from html import escape
+
+    rows = [[
+        f'<a href="{escape(e["report"])}" style="color:var(--accent2)">{escape(e["name"])}</a>',
+        f"<code>{escape(e['path'])}</code>",
+        f"{e['data']['total_rows']:,}",
+        e["data"]["stats"]["rating"]["mean"],
+        e["data"]["generated_at"],
+    ] for e in entries]
+    table = _html_table(["データセット", "入力", "行数", "平均評価", "集計日時"], rows)
+    page = f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+  <meta charset="UTF-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1.0">
+  <title>アニメデータセット EDA レポート一覧</title>
+  <style>
+{REPORT_CSS}  </style>
+</head>
+<body>
+  <h1>アニメデータセット EDA レポート一覧</h1>
+  <p class="meta">{len(entries)} データセット ／ 生成日時: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}</p>
+  <section>
+    {table}
+  </section>
+</body>
+</html>"""
+    tmp = output_path.with_name(output_path.name + ".tmp")
+    tmp.write_text(page, encoding="utf-8")
+    os.replace(tmp, output_path)
+
+
+def publish_latest(report: Path, latest: Path) -> None:
+    """latest をレポートと同じ内容にアトミックに差し替える
+
+    ハードリンク（不可ならファイルコピー）で一時ファイルを作り os.replace で置き換えるため、
+    読み手が書きかけの latest を見ることはない。
+    """
+    if latest.exists() and os.path.samefile(report, latest):
+        return
+    tmp = latest.with_name(latest.name + ".tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(report, tmp)
+    except OSError:
+        shutil.copyfile(report, tmp)
+    os.replace(tmp, latest)
+
+
+# ══════════════════════════════════════════════════════════
+# サーバー層 — DuckDB 接続と集計結果を保持したままレポートを配信する
+# ══════════════════════════════════════════════════════════
+
+# 配信する HTML に差し込むスクリプト: /data.json の ETag を定期的に確認し、変わったら再読み込み
+LIVE_RELOAD_SECONDS = 5
+_LIVE_RELOAD_JS = """  <script>
+  setInterval(async () => {{
+    try {{
+      const res = await fetch('/data.json', {{ method: 'HEAD', cache: 'no-store' }});
+      if (res.headers.get('ETag') !== '{etag}') location.reload();
+    }} catch (e) {{}}
+  }}, {interval});
+  </script>
+"""
+
+
+class ReportState:
+    """serve モードの状態: 1 本の DuckDB 接続と、集計結果・描画済みの HTML / JSON を保持する
+
+    snapshot() のたびに入力ファイル（組になるジャンル表を含む）のサイズと mtime だけを確認し、
+    変わっていたときに限り同じ接続の上でビューを作り直して再集計する。変わっていなければ作成済みのバイト列を返すだけ。
+    """
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, data_path: str,
+                 ratings_path: str | None = None, materialize: bool = False,
+                 approx: bool = False, workers: int = 1, compress: bool = False):
+        self.con = con
+        self.data_path = data_path
+        self.ratings_path = ratings_path
+        self.materialize = materialize
+        self.approx = approx
+        self.workers = workers
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._etag = self._html = self._json = None
+
+    def _input_stamp(self) -> tuple:
+        paths = [self.data_path, self.ratings_path, *genre_table_files(self.data_path).values()]
+        return tuple(file_stamp(path) for path in paths if path)
+
+    def _refresh(self) -> None:
+        t0 = time.perf_counter()
+        build_view(self.con, self.data_path, materialize=self.materialize, approx=self.approx)
+        if self.ratings_path:
+            build_rating_view(self.con, self.data_path, self.ratings_path)
+        data = fetch_data(self.con, workers=self.workers, ratings=self.ratings_path is not None)
+
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        page = "".join(iter_html(data, self.compress, self.data_path))
+        head, sep, tail = page.rpartition("</body>")
+        reload_js = _LIVE_RELOAD_JS.format(etag=etag, interval=LIVE_RELOAD_SECONDS * 1000)
+        self._html = (head + reload_js + sep + tail).encode("utf-8")
+        self._json = body
+        self._etag = etag
+        print(f"🔄 Report refreshed in {time.perf_counter() - t0:.2f}s (ETag {etag})",
+              file=sys.stderr)
+
+    def snapshot(self) -> tuple[str, bytes, bytes]:
+        """最新の (etag, html, json) を返す。入力ファイルが変わっていれば先に再集計する"""
+        import duckdb
+
+        with self._lock:
+            stamp = self._input_stamp()
+            if stamp != self._stamp:
+                # 書き込み途中などで失敗しても、次に入力が変わるまでは前回の結果を配信し続ける
+                self._stamp = stamp
+                try:
+                    self._refresh()
+                except duckdb.Error as e:
+                    if self._etag is None:
+                        raise
+                    print(f"⚠️  Refresh failed, serving previous results: {e}", file=sys.stderr)
+            return self._etag, self._html, self._json
+
+
+def make_handler(state: ReportState) -> type[BaseHTTPRequestHandler]:
+    """GET / と /report.html で HTML、/data.json で fetch_data() の結果を返すハンドラを作る
+
+    ETag が If-None-Match と一致すれば 304 を返すので、ポーリングするダッシュボードは
+    入力が変わらない限りファイルの stat 1 回分のコストしかかからない。
+    """
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit
+
+    routes = {"/": ("text/html", 1), "/report.html": ("text/html", 1),
+              "/data.json": ("application/json", 2)}
+
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, send_body: bool) -> None:
+            route = routes.get(urlsplit(self.path).path)
+            if route is None:
+                self.send_error(404)
+                return
+            content_type, index = route
+            snapshot = state.snapshot()
+            etag, body = snapshot[0], snapshot[index]
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._respond(send_body=True)
+
+        def do_HEAD(self) -> None:
+            self._respond(send_body=False)
+
+        def log_message(self, format: str, *args) -> None:
+            print(f"  {self.address_string()} {format % args}", file=sys.stderr)
+
+    return Handler
+
+
+def serve(state: ReportState, host: str, port: int) -> None:
+    """最初の集計を済ませてから HTTP サーバーを起動し、Ctrl+C まで配信する"""
+    from http.server import ThreadingHTTPServer
+
+    state.snapshot()
+    with ThreadingHTTPServer((host, port), make_handler(state)) as httpd:
+        print(f"🌐 Serving report on http://{host}:{httpd.server_port}/ "
+              f"(JSON: /data.json, Ctrl+C で終了)", file=sys.stderr)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
 
 
 # ══════════════════════════════════════════════════════════
 # エントリーポイント
 # ══════════════════════════════════════════════════════════
 
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """--data のパス・glob パターンを展開し、重複を除いた入力ファイルのリストを返す"""
+    paths: list[str] = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths += [p for p in matches if p not in paths]
+    return paths
+
+
+def dataset_names(paths: list[str]) -> list[str]:
+    """入力ファイルごとに、共通の親ディレクトリからの相対パスを元にした一意な名前を付ける
+
+    例: data/raw/anime.csv, data/processed/anime_processed.csv → raw_anime, processed_anime_processed
+    """
+    resolved = [Path(p).resolve() for p in paths]
+    root = Path(os.path.commonpath([p.parent for p in resolved]))
+    names = []
+    for path in resolved:
+        stem = path.relative_to(root).with_suffix("")
+        name = "".join(c if c.isalnum() or c in "-." else "_" for c in stem.as_posix()) or "dataset"
+        while name in names:
+            name += "_"
+        names.append(name)
+    return names
+
+
+def report_many(args: argparse.Namespace, paths: list[str], resolve, connect) -> None:
+    """--data に複数の入力を指定したときのバッチモード
+
+    キャッシュに無いデータセットだけを fetch_many() で 1 本の接続にまとめて集計し
+    （--workers はデータセット単位の並行数になる）、レポートは <output-dir>/<名前>/ へ、
+    全データセットへのリンクを <output-dir>/index.html へ書き出す。
+    """
+    jobs = [(path, *resolve(path)) for path in paths]
+    keys = [None if args.no_cache else cache_key(path, **options) for path, _, options in jobs]
+    results = [load_cache(args.cache_dir, key) if key and not args.refresh_cache else None
+               for key in keys]
+    todo = [i for i, data in enumerate(results) if data is None]
+    if len(todo) < len(jobs):
+        print(f"⚡ Using cached results for {len(jobs) - len(todo)} of {len(jobs)} datasets",
+              file=sys.stderr)
+    if todo:
+        print(f"🔍 Fetching data for {len(todo)} datasets...", file=sys.stderr)
+        con = connect()
+        fetched = fetch_many(con, [jobs[i][:2] for i in todo], materialize=args.materialize,
+                             approx=args.approx, workers=args.workers)
+        con.close()
+        for i, data in zip(todo, fetched):
+            results[i] = data
+            if keys[i]:
+                save_cache(args.cache_dir, keys[i], data)
+
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    entries = []
+    for name, (path, _, _), data in zip(dataset_names(paths), jobs, results):
+        if args.report in ("console", "both"):
+            print(f"\n══════ {name} ({path}) ══════")
+            render_console(data)
+        if args.report in ("html", "both"):
+            out_dir = args.output_dir / name
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out_file = out_dir / f"anime_eda_{ts}.html"
+            render_html(data, out_file, compress=args.compress_payload, source=path)
+            publish_latest(out_file, out_dir / "anime_eda_latest.html")
+            entries.append({"name": name, "path": path, "data": data,
+                            "report": f"{name}/{out_file.name}"})
+            print(f"✅ HTML report saved → {out_file}", file=sys.stderr)
+
+    if entries:
+        index_file = args.output_dir / "index.html"
+        render_index(entries, index_file)
+        print(f"\n✅ Index     saved → {index_file}", file=sys.stderr)
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Anime Dataset EDA")
     parser.add_argument(
@@ -744,17 +1836,143 @@ def main() -> None:
         help="HTML レポートの出力先ディレクトリ (default: reports/)"
     )
     parser.add_argument(
-        "--data", type=str, default="data/processed/anime_processed.csv",
-        help="CSV ファイルパス (default: data/processed/anime_processed.csv)"
+        "--data", nargs="+", default=["data/processed/anime_processed.csv"], metavar="PATH",
+        help="CSV / Parquet / .duckdb ファイルパス。複数のパスや glob（引用符で囲む）を指定すると、"
+             "1 プロセスで全データセットのレポートと index.html を生成する "
+             "(default: data/processed/anime_processed.csv)"
+    )
+    parser.add_argument(
+        "--materialize", action="store_true",
+        help="データを一度だけ読み込みインメモリテーブル化してから集計する"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="fetch_data() の各セクションを並行実行するスレッド数 (default: 1 = 逐次実行)"
+    )
+    parser.add_argument(
+        "--approx", action="store_true",
+        help="分位点をスケッチ（approx_quantile）で近似集計し、列全体のソートを避ける（数億行の入力向け）。"
+             "--ratings のユーザー・アニメ単位の集計は厳密なままで、そのメモリはユーザー数・アニメ数に比例する"
+    )
+    parser.add_argument(
+        "--ratings", nargs="?", const="", metavar="PATH",
+        help="評価データ（ユーザー × アニメ）の分析セクションを追加する"
+             "（PATH 省略時は --data と同じ場所の rating_processed / rating テーブル）"
+    )
+    parser.add_argument(
+        "--memory-limit", metavar="SIZE",
+        help="DuckDB のメモリ上限（例: 4GB）。超えた分は一時ファイルへ退避して集計する "
+             "(default: DuckDB の既定 = 物理メモリの 80%%)"
+    )
+    parser.add_argument(
+        "--compress-payload", action="store_true",
+        help="HTML に埋め込むグラフ用データを gzip + base64 で圧縮する"
+             "（ブラウザの DecompressionStream で展開。散布図の点が多いレポート向け）"
+    )
+    parser.add_argument(
+        "--serve", nargs="?", type=int, const=8000, metavar="PORT",
+        help="レポート（/）と集計結果 JSON（/data.json）をローカル HTTP サーバーで配信し続ける。"
+             "入力ファイルが変わったときだけ再集計する (PORT 省略時: 8000)"
+    )
+    parser.add_argument(
+        "--host", default="127.0.0.1",
+        help="--serve の待ち受けアドレス (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--cache-dir", type=Path, default=Path(".cache/eda"),
+        help="集計結果キャッシュの保存先 (default: .cache/eda/)"
+    )
+    cache_group = parser.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no-cache", action="store_true",
+        help="キャッシュを読み書きせずに毎回集計する"
+    )
+    cache_group.add_argument(
+        "--refresh-cache", action="store_true",
+        help="キャッシュを無視して再集計し、結果でキャッシュを上書きする"
+    )
+    parser.add_argument(
+        "--profile", nargs="?", const="table", choices=["table", "json", "both"],
+        help="セクションごとのクエリ時間・行数・DuckDB プロファイルを計測する"
+             "（table: 標準エラーに表示 / json: 出力先ディレクトリへ保存 / both）"
     )
     args = parser.parse_args()
 
-    con = duckdb.connect()
-    build_view(con, args.data)
-
-    print("🔍 Fetching data...", file=sys.stderr)
-    data = fetch_data(con)
-    con.close()
+    paths = expand_inputs(args.data)
+    if not paths:
+        parser.error(f"--data に一致するファイルがありません: {' '.join(args.data)}")
+    if len(paths) > 1:
+        for flag, used in (("--serve", args.serve is not None), ("--profile", args.profile),
+                           ("--ratings PATH", args.ratings)):
+            if used:
+                parser.error(f"{flag} は --data を 1 つだけ指定したときに使えます")
+
+    def resolve(data_path: str) -> tuple[str | None, dict]:
+        """データセットごとの評価データのパスとキャッシュキーのオプション"""
+        ratings_path = None
+        cache_options = {"approx": True} if args.approx else {}
+        if args.ratings is not None:
+            ratings_path = rating_source(data_path, args.ratings)
+            if not Path(ratings_path).exists():
+                parser.error(f"評価データが見つかりません: {ratings_path}（--ratings PATH で指定）")
+            st = os.stat(ratings_path)
+            cache_options["ratings"] = [str(Path(ratings_path).resolve()), st.st_size, st.st_mtime_ns]
+        return ratings_path, cache_options
+
+    def connect() -> duckdb.DuckDBPyConnection:
+        import duckdb
+
+        con = duckdb.connect()
+        if args.memory_limit:
+            try:
+                con.execute(f"SET memory_limit = '{args.memory_limit}'")
+            except duckdb.Error as e:
+                parser.error(f"--memory-limit: {e}")
+        return con
+
+    if len(paths) > 1:
+        report_many(args, paths, resolve, connect)
+        return
+
+    data_path = paths[0]
+    ratings_path, cache_options = resolve(data_path)
+    if args.serve is not None:
+        # サーバーは接続と結果をメモリに保持するので、ディスクのキャッシュは使わない
+        serve(ReportState(connect(), data_path, ratings_path, materialize=args.materialize,
+                          approx=args.approx, workers=args.workers,
+                          compress=args.compress_payload),
+              args.host, args.serve)
+        return
+
+    key = None if args.no_cache else cache_key(data_path, **cache_options)
+    # 計測時はクエリを必ず実行する（結果はキャッシュへ保存する）
+    use_cached = key and not args.refresh_cache and not args.profile
+    data = load_cache(args.cache_dir, key) if use_cached else None
+
+    if data is not None:
+        print(f"⚡ Using cached results ({args.cache_dir / key}.json)", file=sys.stderr)
+    else:
+        con = connect()
+        build_view(con, data_path, materialize=args.materialize, approx=args.approx)
+        if ratings_path:
+            build_rating_view(con, data_path, ratings_path)
+
+        print("🔍 Fetching data...", file=sys.stderr)
+        profiler = QueryProfiler() if args.profile else None
+        data = fetch_data(con, profiler, workers=args.workers, ratings=ratings_path is not None)
+        con.close()
+        if key:
+            save_cache(args.cache_dir, key, data)
+
+        if args.profile in ("table", "both"):
+            render_profile(profiler.records)
+        if args.profile in ("json", "both"):
+            args.output_dir.mkdir(parents=True, exist_ok=True)
+            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+            profile_file = args.output_dir / f"anime_eda_profile_{ts}.json"
+            profile_file.write_text(
+                json.dumps(profiler.records, indent=2, ensure_ascii=False), encoding="utf-8")
+            print(f"✅ Profile saved → {profile_file}", file=sys.stderr)
 
     if args.report in ("console", "both"):
         render_console(data)
@@ -764,8 +1982,8 @@ def main() -> None:
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         out_file = args.output_dir / f"anime_eda_{ts}.html"
         latest_file = args.output_dir / "anime_eda_latest.html"
-        render_html(data, out_file)
-        latest_file.write_text(out_file.read_text(encoding="utf-8"), encoding="utf-8")
+        render_html(data, out_file, compress=args.compress_payload, source=data_path)
+        publish_latest(out_file, latest_file)
         print(f"\n✅ HTML report saved → {out_file}", file=sys.stderr)
         print(f"✅ Latest    updated → {latest_file}", file=sys.stderr)
 
@@ -13,19 +13,517 @@ Steps:
    - Remove rows where rating == -1 (means "watched but not rated")
    - Re-encode user_id and anime_id to contiguous integers (0-indexed)
    - Only keep ratings for anime that exist in anime.csv
-4. Save to data/processed/
+4. Normalize the comma-separated 'genre' into a genre dictionary and an
+   anime_genre(anime_idx, genre_id) bridge table
+5. Save to data/processed/
+
+Usage:
+  uv run preprocess.py                       # load rating.csv in memory (default)
+  uv run preprocess.py --chunksize 1000000   # stream rating.csv in bounded chunks
+  uv run preprocess.py --engine duckdb       # run the whole pipeline as DuckDB SQL
+  uv run preprocess.py --format parquet      # write typed, zstd-compressed Parquet
+  uv run preprocess.py --duckdb data/processed/anime.duckdb   # also build a DuckDB file
+  uv run preprocess.py --csr                 # also write the rating matrix as CSR/CSC .npy
+  uv run preprocess.py --stable-ids          # keep existing indices, append new ids only
+  uv run preprocess.py --incremental         # only process rows appended to rating.csv
 """
 
+import argparse
+import hashlib
 import html
+import io
+import json
 import os
 
+import duckdb
+import numpy as np
 import pandas as pd
 
 
-def main() -> None:
-    raw_dir = os.path.join("data", "raw")
-    processed_dir = os.path.join("data", "processed")
-    os.makedirs(processed_dir, exist_ok=True)
+# Column types for typed outputs (Parquet, DuckDB); others keep their inferred type
+COLUMN_TYPES = {
+    "anime_processed": {
+        "anime_id": "INTEGER", "members": "INTEGER", "anime_idx": "INTEGER",
+    },
+    "rating_processed": {
+        "user_id": "INTEGER", "anime_id": "INTEGER", "rating": "TINYINT",
+        "user_idx": "INTEGER", "anime_idx": "INTEGER",
+    },
+    "user_id_map": {"user_id": "INTEGER", "user_idx": "INTEGER"},
+    "anime_id_map": {"anime_id": "INTEGER", "anime_idx": "INTEGER"},
+    "genre": {"genre_id": "SMALLINT"},
+    "anime_genre": {"anime_idx": "INTEGER", "genre_id": "SMALLINT"},
+}
+
+# Table name and sort key of each artifact inside the --duckdb database
+DUCKDB_TABLES = {
+    "anime_processed": ("anime", "anime_idx"),
+    "rating_processed": ("rating", "user_idx, anime_idx"),
+    "user_id_map": ("user_id_map", "user_idx"),
+    "anime_id_map": ("anime_id_map", "anime_idx"),
+    "genre": ("genre", "genre_id"),
+    "anime_genre": ("anime_genre", "anime_idx, genre_id"),
+}
+
+
+def typed(query: str, name: str) -> str:
+    """Wrap `query` so its columns are cast to COLUMN_TYPES[name]."""
+    casts = ", ".join(
+        f"{col}::{typ} AS {col}" for col, typ in COLUMN_TYPES.get(name, {}).items()
+    )
+    return f"SELECT * REPLACE ({casts}) FROM ({query})" if casts else query
+
+
+def scan(path: str) -> str:
+    """DuckDB table function reading a processed artifact (CSV or Parquet)."""
+    if path.endswith(".parquet"):
+        return f"read_parquet('{path}')"
+    return f"read_csv_auto('{path}', header=true)"
+
+
+def copy_to(con: duckdb.DuckDBPyConnection, query: str, processed_dir: str,
+            name: str, fmt: str) -> str:
+    """Write the result of `query` to data/processed/<name>.<fmt> with COPY."""
+    out = os.path.join(processed_dir, f"{name}.{fmt}")
+    if fmt == "parquet":
+        query = typed(query, name)
+        options = "FORMAT parquet, COMPRESSION zstd"
+    else:
+        options = "FORMAT csv, HEADER"
+    print(f"Saving {out} ...")
+    con.execute(f"COPY ({query}) TO '{out}' ({options})")
+    return out
+
+
+def build_database(processed_dir: str, fmt: str, db_path: str) -> None:
+    """Load the processed artifacts into typed tables of a DuckDB database file.
+
+    Each table is written sorted on its index columns, so the min/max zone maps
+    DuckDB keeps per row group can skip most of the data for range filters.
+    The file is built next to `db_path` and moved into place when complete.
+    """
+    tmp = db_path + ".tmp"
+    for stale in (tmp, tmp + ".wal"):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    print(f"\nBuilding {db_path} ...")
+    con = duckdb.connect(tmp)
+    for name, (table, order) in DUCKDB_TABLES.items():
+        src = os.path.join(processed_dir, f"{name}.{fmt}")
+        con.execute(f"""
+        CREATE TABLE {table} AS
+        {typed(f"SELECT * FROM {scan(src)}", name)}
+        ORDER BY {order}
+        """)
+        rows = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"  {table:<13}: {rows:,} rows")
+    con.execute("CHECKPOINT")
+    con.close()
+    os.replace(tmp, db_path)
+
+
+MATRIX_DIR = "rating_matrix"
+
+
+def build_rating_matrix(processed_dir: str, fmt: str) -> str:
+    """Write the user x anime rating matrix as CSR and CSC arrays of raw .npy files.
+
+    data/processed/rating_matrix/ gets {csr,csc}_{indptr,indices,data}.npy:
+    CSR rows are user_idx and CSC columns are anime_idx, indices are int32
+    and data is the int8 rating. indptr is int32 while the number of ratings
+    fits, so scipy.sparse takes the arrays as they are (no copy, no upcast).
+    A repeated (user, anime) pair keeps its last rating in file order.
+    """
+    out_dir = os.path.join(processed_dir, MATRIX_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    src = os.path.join(processed_dir, f"rating_processed.{fmt}")
+
+    print(f"\nBuilding {out_dir}/ ...")
+    con = duckdb.connect()
+    try:
+        cols = con.execute(f"""
+        WITH r AS (
+            SELECT user_idx, anime_idx, rating, ROW_NUMBER() OVER () AS rn
+            FROM {scan(src)}
+        )
+        SELECT user_idx::INTEGER AS user_idx, anime_idx::INTEGER AS anime_idx,
+               arg_max(rating, rn)::TINYINT AS rating
+        FROM r
+        GROUP BY user_idx, anime_idx
+        ORDER BY user_idx, anime_idx
+        """).fetchnumpy()
+        n_users, n_anime = con.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM {scan(os.path.join(processed_dir, f"user_id_map.{fmt}"))}),
+            (SELECT COUNT(*) FROM {scan(os.path.join(processed_dir, f"anime_id_map.{fmt}"))})
+        """).fetchone()
+    finally:
+        con.close()
+
+    user_idx = np.asarray(cols["user_idx"], dtype=np.int32)
+    anime_idx = np.asarray(cols["anime_idx"], dtype=np.int32)
+    rating = np.asarray(cols["rating"], dtype=np.int8)
+    ptr_dtype = np.int32 if len(rating) < 2**31 else np.int64
+
+    def _save(layout: str, major, minor, n_major: int, data) -> None:
+        indptr = np.zeros(n_major + 1, dtype=ptr_dtype)
+        np.cumsum(np.bincount(major, minlength=n_major), out=indptr[1:])
+        for part, arr in (("indptr", indptr), ("indices", minor), ("data", data)):
+            np.save(os.path.join(out_dir, f"{layout}_{part}.npy"), arr)
+
+    # Rows come back sorted by (user, anime): CSR as is, CSC after a stable sort
+    _save("csr", user_idx, anime_idx, n_users, rating)
+    order = np.argsort(anime_idx, kind="stable")
+    _save("csc", anime_idx[order], user_idx[order], n_anime, rating[order])
+    print(f"  {n_users:,} users x {n_anime:,} anime, {len(rating):,} ratings")
+    return out_dir
+
+
+def load_rating_matrix(processed_dir: str = os.path.join("data", "processed"),
+                       layout: str = "csr", mmap: bool = True):
+    """Open the arrays written by `build_rating_matrix`.
+
+    Returns (indptr, indices, data, shape); with mmap=True the arrays are
+    read-only memory maps, so opening the matrix reads no rating data.
+
+    Usage:
+        indptr, indices, data, shape = load_rating_matrix()
+        matrix = scipy.sparse.csr_matrix((data, indices, indptr), shape=shape)
+    """
+    if layout not in ("csr", "csc"):
+        raise ValueError(f"layout must be 'csr' or 'csc', not {layout!r}")
+
+    def _load(name: str) -> np.ndarray:
+        path = os.path.join(processed_dir, MATRIX_DIR, f"{name}.npy")
+        return np.load(path, mmap_mode="r" if mmap else None)
+
+    shape = tuple(len(_load(f"{layout_name}_indptr")) - 1 for layout_name in ("csr", "csc"))
+    return (_load(f"{layout}_indptr"), _load(f"{layout}_indices"),
+            _load(f"{layout}_data"), shape)
+
+
+def save_frame(df: pd.DataFrame, processed_dir: str, name: str, fmt: str) -> str:
+    """Save a DataFrame as data/processed/<name>.<fmt>."""
+    if fmt == "csv":
+        out = os.path.join(processed_dir, f"{name}.csv")
+        print(f"Saving {out} ...")
+        df.to_csv(out, index=False)
+        return out
+    # pandas needs pyarrow for Parquet; DuckDB can scan the frame directly
+    con = duckdb.connect()
+    con.register("frame", df)
+    try:
+        return copy_to(con, "SELECT * FROM frame", processed_dir, name, fmt)
+    finally:
+        con.close()
+
+
+def genre_tables(anime_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Split 'genre' into a (genre_id, genre) dictionary and a bridge table.
+
+    genre_id follows the sorted genre names and the bridge holds one
+    (anime_idx, genre_id) row per distinct genre of each anime, sorted.
+    """
+    pairs = (
+        anime_df[["anime_idx", "genre"]]
+        .assign(genre=anime_df["genre"].str.split(","))
+        .explode("genre")
+    )
+    pairs["genre"] = pairs["genre"].str.strip()
+    pairs = pairs[pairs["genre"] != ""]
+    names, genre_id = np.unique(pairs["genre"].to_numpy(dtype=str), return_inverse=True)
+    genre_df = pd.DataFrame({"genre_id": np.arange(len(names)), "genre": names})
+    bridge_df = (
+        pd.DataFrame({"anime_idx": pairs["anime_idx"].to_numpy(),
+                      "genre_id": genre_id})
+        .drop_duplicates()
+        .sort_values(["anime_idx", "genre_id"])
+    )
+    return genre_df, bridge_df
+
+
+class IdEncoder:
+    """Vectorized mapping between raw ids and contiguous 0-indexed integers.
+
+    Index i stands for ``ids[i]``. ``fit`` sorts the distinct ids, so the
+    encoding is the same as ``enumerate(sorted(ids))``. Lookups go through a
+    dense table when the id range is compact (O(1) per id) and fall back to
+    ``np.searchsorted`` otherwise; no Python dict is ever built.
+
+    Usage:
+        enc = IdEncoder.load("data/processed/user_id_map.csv")
+        user_idx = enc.transform(batch_user_ids)
+    """
+
+    # Build a dense lookup table while it costs at most this many slots per id
+    DENSE_RATIO = 8
+
+    def __init__(self, ids, id_col: str = "id", idx_col: str = "idx") -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.id_col = id_col
+        self.idx_col = idx_col
+        if len(np.unique(self.ids)) != len(self.ids):
+            raise ValueError(f"duplicate {id_col} values in encoder")
+
+        self._lut = None
+        self._sorter = None
+        if len(self.ids) == 0:
+            return
+        self._offset = int(self.ids.min())
+        span = int(self.ids.max()) - self._offset + 1
+        if span <= self.DENSE_RATIO * len(self.ids):
+            self._lut = np.full(span, -1, dtype=np.int64)
+            self._lut[self.ids - self._offset] = np.arange(len(self.ids))
+        else:
+            self._sorter = np.argsort(self.ids, kind="stable")
+
+    @classmethod
+    def fit(cls, values, id_col: str = "id", idx_col: str = "idx") -> "IdEncoder":
+        """Assign indices to the distinct values in ascending id order."""
+        return cls(np.unique(np.asarray(values)), id_col, idx_col)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def transform(self, values, strict: bool = True) -> np.ndarray:
+        """Map raw ids to indices; unknown ids raise, or become -1 if not strict."""
+        values = np.asarray(values, dtype=np.int64)
+        if len(self.ids) == 0:
+            out = np.full(values.shape, -1, dtype=np.int64)
+        elif self._lut is not None:
+            pos = values - self._offset
+            inside = (pos >= 0) & (pos < len(self._lut))
+            out = np.where(inside, self._lut[np.where(inside, pos, 0)], -1)
+        else:
+            pos = np.searchsorted(self.ids, values, sorter=self._sorter)
+            cand = self._sorter[np.minimum(pos, len(self.ids) - 1)]
+            out = np.where(self.ids[cand] == values, cand, -1)
+        if strict and (out < 0).any():
+            missing = np.unique(values[out < 0])
+            raise KeyError(f"unknown {self.id_col}: {missing[:10].tolist()}")
+        return out
+
+    def extend(self, values) -> "IdEncoder":
+        """Return an encoder that keeps every existing index and appends unseen ids.
+
+        New ids get the next indices in ascending id order, so extending an
+        empty encoder is the same as ``fit``.
+        """
+        new = np.setdiff1d(np.unique(np.asarray(values, dtype=np.int64)), self.ids)
+        return type(self)(np.concatenate([self.ids, new]), self.id_col, self.idx_col)
+
+    def inverse_transform(self, idx) -> np.ndarray:
+        """Map indices back to raw ids."""
+        return self.ids[np.asarray(idx)]
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame({
+            self.id_col: self.ids,
+            self.idx_col: np.arange(len(self.ids), dtype=np.int64),
+        })
+
+    def save(self, path: str) -> str:
+        """Save as an id map (<id_col>,<idx_col>); the format follows the suffix."""
+        out_dir, filename = os.path.split(path)
+        name, ext = os.path.splitext(filename)
+        return save_frame(self.to_frame(), out_dir, name, ext.lstrip("."))
+
+    @classmethod
+    def load(cls, path: str) -> "IdEncoder":
+        """Load an id map written by `save` (or by preprocess.py)."""
+        con = duckdb.connect()
+        try:
+            rel = con.sql(f"SELECT * FROM {scan(str(path))}")
+            id_col, idx_col = rel.columns[:2]
+            cols = rel.order(idx_col).fetchnumpy()
+        finally:
+            con.close()
+        idx = cols[idx_col]
+        if not np.array_equal(idx, np.arange(len(idx))):
+            raise ValueError(f"{path}: {idx_col} is not contiguous from 0")
+        return cls(cols[id_col], id_col, idx_col)
+
+
+def find_output(processed_dir: str, name: str, fmt: str | None = None) -> str | None:
+    """Path of the most recently written data/processed/<name>.csv / .parquet (None if neither).
+
+    After a switch of --format the other format's file is left behind stale,
+    so the newer file wins; on equal mtimes `fmt` (the format in use) does.
+    """
+    paths = [os.path.join(processed_dir, f"{name}.{ext}") for ext in ("csv", "parquet")]
+    found = [p for p in paths if os.path.exists(p)]
+    if not found:
+        return None
+    return max(found, key=lambda p: (os.stat(p).st_mtime_ns, p.endswith(f".{fmt}")))
+
+
+def previous_encoder(processed_dir: str, name: str, id_col: str,
+                     idx_col: str, fmt: str | None = None) -> IdEncoder:
+    """Load the id map <name>.csv / <name>.parquet of an earlier run (empty if none)."""
+    path = find_output(processed_dir, name, fmt)
+    if path is None:
+        return IdEncoder(np.empty(0, dtype=np.int64), id_col, idx_col)
+    return IdEncoder.load(path)
+
+
+def report_extended(id_col: str, kept: int, size: int) -> None:
+    print(f"  {id_col}: kept {kept:,} existing indices, appended {size - kept:,} new")
+
+
+def iter_rating_chunks(path: str | io.BytesIO, chunksize: int, valid_anime_ids: set):
+    """Stream rating.csv (a path or an in-memory buffer) in chunks, filtering each chunk.
+
+    Yields (raw_rows, unrated_rows, unknown_anime_rows, chunk) so callers can
+    report the same counts as the in-memory path without holding the file.
+    """
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        raw_rows = len(chunk)
+        chunk = chunk[chunk["rating"] != -1]
+        rated_rows = len(chunk)
+        chunk = chunk[chunk["anime_id"].isin(valid_anime_ids)]
+        yield raw_rows, raw_rows - rated_rows, rated_rows - len(chunk), chunk
+
+
+def run_duckdb(raw_dir: str, processed_dir: str, fmt: str,
+               stable_ids: bool = False) -> None:
+    """Run the same pipeline as DuckDB SQL (multi-threaded, spills to disk).
+
+    The outputs are byte-identical to the pandas path: row order of the raw
+    files is kept through an explicit row number and the id maps are the
+    DENSE_RANK() of the sorted distinct ids (appended after the previous
+    maps with `stable_ids`).
+    """
+    anime_path = os.path.join(raw_dir, "anime.csv")
+    rating_path = os.path.join(raw_dir, "rating.csv")
+
+    con = duckdb.connect()
+    # Reuse html.unescape as a UDF so decoding matches the pandas path exactly
+    # (NULLs bypass the UDF, like the pd.notna guard there)
+    con.create_function("decode_entities", html.unescape, ["VARCHAR"], "VARCHAR")
+
+    print(f"Cleaning {anime_path} ...")
+    raw_anime = con.execute(
+        f"SELECT COUNT(*) FROM read_csv_auto('{anime_path}', header=true)"
+    ).fetchone()[0]
+    con.execute(f"""
+    CREATE TEMP TABLE anime AS
+    WITH raw AS (
+        SELECT *, ROW_NUMBER() OVER () AS rn
+        FROM read_csv_auto('{anime_path}', header=true)
+    )
+    SELECT
+        anime_id,
+        decode_entities(name)          AS name,
+        decode_entities(genre)         AS genre,
+        type,
+        TRY_CAST(episodes AS DOUBLE)   AS episodes,
+        rating,
+        members,
+        rn
+    FROM raw
+    WHERE rating IS NOT NULL AND genre IS NOT NULL
+    """)
+    kept_anime = con.execute("SELECT COUNT(*) FROM anime").fetchone()[0]
+    print(f"  Dropped {raw_anime - kept_anime} anime rows with missing rating/genre")
+
+    print(f"\nCleaning {rating_path} ...")
+    con.execute(f"""
+    CREATE TEMP TABLE rating AS
+    WITH raw AS (
+        SELECT user_id, anime_id, rating, ROW_NUMBER() OVER () AS rn
+        FROM read_csv_auto('{rating_path}', header=true)
+    )
+    SELECT * FROM raw
+    WHERE rating <> -1
+      AND anime_id IN (SELECT anime_id FROM anime)
+    """)
+    for name, id_col, idx_col in [("user_id_map", "user_id", "user_idx"),
+                                  ("anime_id_map", "anime_id", "anime_idx")]:
+        if stable_ids:
+            prev = previous_encoder(processed_dir, name, id_col, idx_col, fmt)
+            con.register(f"prev_{name}", prev.to_frame())
+            previous = f"SELECT * FROM prev_{name}"
+        else:
+            previous = f"SELECT NULL::BIGINT AS {id_col}, NULL::BIGINT AS {idx_col} LIMIT 0"
+        con.execute(f"""
+        CREATE TEMP TABLE {name} AS
+        WITH prev AS ({previous})
+        SELECT {id_col}, {idx_col} FROM prev
+        UNION ALL
+        SELECT {id_col},
+               (SELECT COUNT(*) FROM prev) + DENSE_RANK() OVER (ORDER BY {id_col}) - 1
+        FROM (
+            SELECT DISTINCT {id_col} FROM rating
+            WHERE {id_col} NOT IN (SELECT {id_col} FROM prev)
+        )
+        """)
+        if stable_ids:
+            size = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            report_extended(id_col, len(prev), size)
+    n_rating, n_users, n_anime = con.execute("""
+    SELECT
+        (SELECT COUNT(*) FROM rating),
+        (SELECT COUNT(DISTINCT user_id) FROM rating),
+        (SELECT COUNT(DISTINCT anime_id) FROM rating)
+    """).fetchone()
+    print(f"  rating rows after cleaning: {n_rating:,}")
+    print(f"  Unique users : {n_users:,}")
+    print(f"  Unique anime : {n_anime:,}")
+
+    con.execute("""
+    CREATE TEMP TABLE anime_genre_name AS
+    SELECT DISTINCT m.anime_idx, TRIM(g) AS genre
+    FROM anime a
+    JOIN anime_id_map m USING (anime_id),
+    UNNEST(str_split(a.genre, ',')) AS t(g)
+    WHERE TRIM(g) <> '' AND a.anime_id IN (SELECT anime_id FROM rating)
+    """)
+    con.execute("""
+    CREATE TEMP TABLE genre AS
+    SELECT DENSE_RANK() OVER (ORDER BY genre) - 1 AS genre_id, genre
+    FROM (SELECT DISTINCT genre FROM anime_genre_name)
+    """)
+
+    outputs = {
+        "anime_processed": """
+            SELECT a.* EXCLUDE (rn), m.anime_idx
+            FROM anime a JOIN anime_id_map m USING (anime_id)
+            WHERE a.anime_id IN (SELECT anime_id FROM rating)
+            ORDER BY a.rn
+        """,
+        "rating_processed": """
+            SELECT r.user_id, r.anime_id, r.rating, u.user_idx, m.anime_idx
+            FROM rating r
+            JOIN user_id_map u USING (user_id)
+            JOIN anime_id_map m USING (anime_id)
+            ORDER BY r.rn
+        """,
+        "user_id_map": "SELECT * FROM user_id_map ORDER BY user_idx",
+        "anime_id_map": "SELECT * FROM anime_id_map ORDER BY anime_idx",
+        "genre": "SELECT * FROM genre ORDER BY genre_id",
+        "anime_genre": """
+            SELECT n.anime_idx, g.genre_id
+            FROM anime_genre_name n JOIN genre g USING (genre)
+            ORDER BY n.anime_idx, g.genre_id
+        """,
+    }
+    print()
+    for name, query in outputs.items():
+        copy_to(con, query, processed_dir, name, fmt)
+    con.close()
+
+    print("\nDone!")
+
+
+def run_pandas(raw_dir: str, processed_dir: str, fmt: str,
+               chunksize: int | None, stable_ids: bool = False) -> None:
+    """Run the pipeline with pandas (in memory, or streaming with `chunksize`).
+
+    With `stable_ids` the id maps of the previous run are loaded and only
+    unseen ids are appended, so existing user_idx / anime_idx never move.
+    """
+    rating_path = os.path.join(raw_dir, "rating.csv")
 
     # ------------------------------------------------------------------ #
     # 1. Load raw data
@@ -34,9 +532,10 @@ def main() -> None:
     anime_df = pd.read_csv(os.path.join(raw_dir, "anime.csv"))
     print(f"  anime.csv shape: {anime_df.shape}")
 
-    print("Loading rating.csv ...")
-    rating_df = pd.read_csv(os.path.join(raw_dir, "rating.csv"))
-    print(f"  rating.csv shape: {rating_df.shape}")
+    if chunksize is None:
+        print("Loading rating.csv ...")
+        rating_df = pd.read_csv(rating_path)
+        print(f"  rating.csv shape: {rating_df.shape}")
 
     # ------------------------------------------------------------------ #
     # 2. Clean anime.csv
@@ -64,62 +563,339 @@ def main() -> None:
     # 3. Clean rating.csv
     # ------------------------------------------------------------------ #
     print("\nCleaning rating.csv ...")
-
-    # Remove unrated entries (-1 means watched but not rated)
-    before = len(rating_df)
-    rating_df = rating_df[rating_df["rating"] != -1].copy()
-    print(f"  Removed {before - len(rating_df)} unrated (-1) entries")
-
-    # Keep only ratings for anime that exist in the cleaned anime list
     valid_anime_ids = set(anime_df["anime_id"].tolist())
-    before = len(rating_df)
-    rating_df = rating_df[rating_df["anime_id"].isin(valid_anime_ids)].copy()
-    print(f"  Removed {before - len(rating_df)} rows with unknown anime_id")
 
-    # Re-encode user_id and anime_id to contiguous 0-indexed integers
-    user_ids = rating_df["user_id"].unique()
-    anime_ids = rating_df["anime_id"].unique()
+    if chunksize is None:
+        # Remove unrated entries (-1 means watched but not rated)
+        before = len(rating_df)
+        rating_df = rating_df[rating_df["rating"] != -1].copy()
+        print(f"  Removed {before - len(rating_df)} unrated (-1) entries")
 
-    user_id_map = {uid: idx for idx, uid in enumerate(sorted(user_ids))}
-    anime_id_map = {aid: idx for idx, aid in enumerate(sorted(anime_ids))}
+        # Keep only ratings for anime that exist in the cleaned anime list
+        before = len(rating_df)
+        rating_df = rating_df[rating_df["anime_id"].isin(valid_anime_ids)].copy()
+        print(f"  Removed {before - len(rating_df)} rows with unknown anime_id")
 
-    rating_df["user_idx"] = rating_df["user_id"].map(user_id_map)
-    rating_df["anime_idx"] = rating_df["anime_id"].map(anime_id_map)
+        user_ids = rating_df["user_id"].unique()
+        anime_ids = rating_df["anime_id"].unique()
+    else:
+        # Pass 1: filter chunk by chunk and only keep the distinct ids, which
+        # are needed up front to build the sorted index maps.
+        user_ids = anime_ids = np.empty(0, dtype=np.int64)
+        total = unrated = unknown = 0
+        for raw_rows, n_unrated, n_unknown, chunk in iter_rating_chunks(
+            rating_path, chunksize, valid_anime_ids
+        ):
+            total += raw_rows
+            unrated += n_unrated
+            unknown += n_unknown
+            user_ids = np.union1d(user_ids, chunk["user_id"].unique())
+            anime_ids = np.union1d(anime_ids, chunk["anime_id"].unique())
+        print(f"  rating.csv shape: ({total}, 3)")
+        print(f"  Removed {unrated} unrated (-1) entries")
+        print(f"  Removed {unknown} rows with unknown anime_id")
 
-    # Also add anime_idx to anime_df
-    anime_df = anime_df[anime_df["anime_id"].isin(anime_id_map)].copy()
-    anime_df["anime_idx"] = anime_df["anime_id"].map(anime_id_map)
+    # Re-encode user_id and anime_id to contiguous 0-indexed integers
+    if stable_ids:
+        encoders = []
+        for name, id_col, idx_col, ids in [("user_id_map", "user_id", "user_idx", user_ids),
+                                           ("anime_id_map", "anime_id", "anime_idx", anime_ids)]:
+            prev = previous_encoder(processed_dir, name, id_col, idx_col, fmt)
+            encoders.append(prev.extend(ids))
+            report_extended(id_col, len(prev), len(encoders[-1]))
+        user_enc, anime_enc = encoders
+    else:
+        user_enc = IdEncoder.fit(user_ids, "user_id", "user_idx")
+        anime_enc = IdEncoder.fit(anime_ids, "anime_id", "anime_idx")
 
-    print(f"  rating_df shape after cleaning: {rating_df.shape}")
-    print(f"  Unique users : {rating_df['user_idx'].nunique():,}")
-    print(f"  Unique anime : {rating_df['anime_idx'].nunique():,}")
+    # Also add anime_idx to anime_df
+    anime_df = anime_df[anime_df["anime_id"].isin(anime_ids)].copy()
+    anime_df["anime_idx"] = anime_enc.transform(anime_df["anime_id"])
 
     # ------------------------------------------------------------------ #
     # 4. Save
     # ------------------------------------------------------------------ #
-    anime_out = os.path.join(processed_dir, "anime_processed.csv")
-    rating_out = os.path.join(processed_dir, "rating_processed.csv")
+    if chunksize is None:
+        rating_df["user_idx"] = user_enc.transform(rating_df["user_id"])
+        rating_df["anime_idx"] = anime_enc.transform(rating_df["anime_id"])
+        rating_shape = rating_df.shape
+
+        print(f"  rating_df shape after cleaning: {rating_shape}")
+        print(f"  Unique users : {rating_df['user_idx'].nunique():,}")
+        print(f"  Unique anime : {rating_df['anime_idx'].nunique():,}")
+
+        print()
+        save_frame(anime_df, processed_dir, "anime_processed", fmt)
+        save_frame(rating_df, processed_dir, "rating_processed", fmt)
+    else:
+        print()
+        save_frame(anime_df, processed_dir, "anime_processed", fmt)
+
+        # Pass 2: re-read, encode and append so only one chunk is in memory.
+        # Parquet cannot be appended to, so stream into a CSV part file and
+        # let DuckDB convert it out-of-core afterwards.
+        rating_out = os.path.join(processed_dir, "rating_processed.csv")
+        if fmt != "csv":
+            rating_out += ".part"
+        print(f"Streaming {rating_out} ...")
+        rows = 0
+        for _, _, _, chunk in iter_rating_chunks(
+            rating_path, chunksize, valid_anime_ids
+        ):
+            chunk = chunk.assign(
+                user_idx=user_enc.transform(chunk["user_id"]),
+                anime_idx=anime_enc.transform(chunk["anime_id"]),
+            )
+            chunk.to_csv(rating_out, mode="w" if rows == 0 else "a",
+                         header=rows == 0, index=False)
+            rows += len(chunk)
+        rating_shape = (rows, 5)
+        if fmt != "csv":
+            con = duckdb.connect()
+            copy_to(con, f"SELECT * FROM read_csv('{rating_out}', header=true)",
+                    processed_dir, "rating_processed", fmt)
+            con.close()
+            os.remove(rating_out)
+
+        print(f"  rating_df shape after cleaning: {rating_shape}")
+        print(f"  Unique users : {len(user_ids):,}")
+        print(f"  Unique anime : {len(anime_ids):,}")
+
+    print("\nDone!")
+    print(f"  anime_processed.{fmt} : {anime_df.shape}")
+    print(f"  rating_processed.{fmt}: {rating_shape}")
+
+    # Save id mappings; IdEncoder.load() reads them back for downstream code
+    user_enc.save(os.path.join(processed_dir, f"user_id_map.{fmt}"))
+    anime_enc.save(os.path.join(processed_dir, f"anime_id_map.{fmt}"))
 
-    print(f"\nSaving {anime_out} ...")
-    anime_df.to_csv(anime_out, index=False)
+    # Genre dictionary and anime_genre bridge for integer joins downstream
+    genre_df, bridge_df = genre_tables(anime_df)
+    save_frame(genre_df, processed_dir, "genre", fmt)
+    save_frame(bridge_df, processed_dir, "anime_genre", fmt)
 
-    print(f"Saving {rating_out} ...")
-    rating_df.to_csv(rating_out, index=False)
 
+STATE_FILE = "preprocess_state.json"
+STATE_VERSION = 1
+DEFAULT_TAIL_CHUNKSIZE = 1_000_000
+
+
+def file_digest(path: str, size: int | None = None) -> str:
+    """sha256 of the first `size` bytes of `path` (the whole file by default)."""
+    h = hashlib.sha256()
+    remaining = os.path.getsize(path) if size is None else size
+    with open(path, "rb") as fp:
+        while remaining > 0:
+            block = fp.read(min(remaining, 1 << 20))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h.hexdigest()
+
+
+def save_state(processed_dir: str, raw_dir: str, fmt: str, rating_size: int) -> None:
+    """Record how far rating.csv has been processed, for the next --incremental run."""
+    rating_path = os.path.join(raw_dir, "rating.csv")
+    state = {
+        "version": STATE_VERSION,
+        "format": fmt,
+        "anime_sha256": file_digest(os.path.join(raw_dir, "anime.csv")),
+        "rating_offset": rating_size,
+        "rating_sha256": file_digest(rating_path, rating_size),
+    }
+    with open(os.path.join(processed_dir, STATE_FILE), "w") as fp:
+        json.dump(state, fp, indent=2)
+
+
+def clear_state(processed_dir: str) -> None:
+    """Forget the --incremental state (the next --incremental run does a full rebuild)."""
+    try:
+        os.remove(os.path.join(processed_dir, STATE_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def run_incremental(raw_dir: str, processed_dir: str, fmt: str,
+                    chunksize: int | None) -> bool:
+    """Clean, encode and append only the rows added to rating.csv since the last run.
+
+    The state file stores the byte offset processed so far and the sha256 of
+    that prefix. Returns False (the caller then does a full rebuild) when
+    there is no usable state, the prefix or anime.csv changed, or the new
+    rows rate an anime that has no anime_idx yet (anime_processed and the
+    genre tables would change too). New users are appended to user_id_map.
+    """
+    rating_path = os.path.join(raw_dir, "rating.csv")
+    rating_out = os.path.join(processed_dir, f"rating_processed.{fmt}")
+    try:
+        with open(os.path.join(processed_dir, STATE_FILE)) as fp:
+            state = json.load(fp)
+    except (OSError, ValueError):
+        print("No incremental state found: full rebuild")
+        return False
+    if state.get("version") != STATE_VERSION or state.get("format") != fmt:
+        print("Incremental state is from another version/format: full rebuild")
+        return False
+    if not os.path.exists(rating_out):
+        print(f"{rating_out} is missing: full rebuild")
+        return False
+
+    offset = state["rating_offset"]
+    size = os.path.getsize(rating_path)
+    if size < offset or file_digest(rating_path, offset) != state["rating_sha256"]:
+        print("rating.csv was modified before the last processed row: full rebuild")
+        return False
+    if file_digest(os.path.join(raw_dir, "anime.csv")) != state["anime_sha256"]:
+        print("anime.csv changed: full rebuild")
+        return False
+
+    # Only complete lines are taken; a row still being written waits for the
+    # next run. The header is re-attached so the tail parses like the full file.
+    with open(rating_path, "rb") as fp:
+        header = fp.readline()
+        fp.seek(offset - 1)
+        if fp.read(1) != b"\n":
+            print("Last processed row of rating.csv was incomplete: full rebuild")
+            return False
+        data = fp.read(size - offset)
+    size = offset + data.rfind(b"\n") + 1
+    if size == offset:
+        print("rating.csv has no new rows: processed outputs are up to date")
+        return True
+    tail = io.BytesIO(header + data[:size - offset])
+
+    print(f"Processing the {size - offset:,} bytes appended to {rating_path} ...")
+    anime_df = pd.read_csv(os.path.join(raw_dir, "anime.csv"))
+    valid_anime_ids = set(anime_df.dropna(subset=["rating", "genre"])["anime_id"].tolist())
+    prev_users = previous_encoder(processed_dir, "user_id_map", "user_id", "user_idx", fmt)
+    anime_enc = previous_encoder(processed_dir, "anime_id_map", "anime_id", "anime_idx", fmt)
+
+    chunks = []
+    total = unrated = unknown = 0
+    for raw_rows, n_unrated, n_unknown, chunk in iter_rating_chunks(
+        tail, chunksize or DEFAULT_TAIL_CHUNKSIZE, valid_anime_ids
+    ):
+        total += raw_rows
+        unrated += n_unrated
+        unknown += n_unknown
+        chunks.append(chunk)
+    tail_df = pd.concat(chunks) if chunks else pd.DataFrame(columns=["user_id", "anime_id", "rating"])
+    print(f"  new rating.csv rows: {total}")
+    print(f"  Removed {unrated} unrated (-1) entries")
+    print(f"  Removed {unknown} rows with unknown anime_id")
+
+    if (anime_enc.transform(tail_df["anime_id"], strict=False) < 0).any():
+        print("New rows rate anime without an anime_idx yet: full rebuild")
+        return False
+    user_enc = prev_users.extend(tail_df["user_id"])
+    report_extended("user_id", len(prev_users), len(user_enc))
+    tail_df = tail_df.assign(
+        user_idx=user_enc.transform(tail_df["user_id"]),
+        anime_idx=anime_enc.transform(tail_df["anime_id"]),
+    )
+
+    print()
+    if fmt == "csv":
+        print(f"Appending {len(tail_df):,} rows to {rating_out} ...")
+        tail_df.to_csv(rating_out, mode="a", header=False, index=False)
+    else:
+        # Parquet cannot be appended to: rewrite it from the old file plus the tail
+        part = rating_out + ".part"
+        prev = rating_out + ".prev"
+        tail_df.to_csv(part, index=False)
+        os.replace(rating_out, prev)
+        con = duckdb.connect()
+        try:
+            copy_to(con, f"""
+                SELECT * EXCLUDE (src, rn) FROM (
+                    SELECT *, 0 AS src, ROW_NUMBER() OVER () AS rn FROM read_parquet('{prev}')
+                    UNION ALL BY NAME
+                    SELECT *, 1 AS src, ROW_NUMBER() OVER () AS rn
+                    FROM read_csv('{part}', header=true)
+                ) ORDER BY src, rn
+            """, processed_dir, "rating_processed", fmt)
+        finally:
+            con.close()
+        os.remove(prev)
+        os.remove(part)
+    if len(user_enc) > len(prev_users):
+        user_enc.save(os.path.join(processed_dir, f"user_id_map.{fmt}"))
+
+    save_state(processed_dir, raw_dir, fmt, size)
     print("\nDone!")
-    print(f"  anime_processed.csv : {anime_df.shape}")
-    print(f"  rating_processed.csv: {rating_df.shape}")
+    return True
 
-    # Save id mappings for convenience
-    user_map_df = pd.DataFrame(
-        list(user_id_map.items()), columns=["user_id", "user_idx"]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Preprocess raw anime dataset")
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="stream rating.csv in chunks of this many rows (default: load it at once)"
+    )
+    parser.add_argument(
+        "--engine", choices=["pandas", "duckdb"], default="pandas",
+        help="processing engine (default: pandas)"
+    )
+    parser.add_argument(
+        "--format", choices=["csv", "parquet"], default="csv",
+        help="output file format for data/processed/ (default: csv)"
+    )
+    parser.add_argument(
+        "--duckdb", metavar="PATH", default=None,
+        help="also build a DuckDB database with typed, sorted tables "
+             "(e.g. data/processed/anime.duckdb)"
+    )
+    parser.add_argument(
+        "--stable-ids", action="store_true",
+        help="load the existing user_id_map/anime_id_map and only append new ids, "
+             "so indices (and artifacts built on them) stay valid across runs"
     )
-    anime_map_df = pd.DataFrame(
-        list(anime_id_map.items()), columns=["anime_id", "anime_idx"]
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only clean and append the rows added to rating.csv since the last "
+             "--incremental run (implies --stable-ids; falls back to a full rebuild "
+             "when earlier rows or anime.csv changed)"
     )
-    user_map_df.to_csv(os.path.join(processed_dir, "user_id_map.csv"), index=False)
-    anime_map_df.to_csv(os.path.join(processed_dir, "anime_id_map.csv"), index=False)
-    print("  user_id_map.csv and anime_id_map.csv saved.")
+    parser.add_argument(
+        "--csr", action="store_true",
+        help="also write the user x anime rating matrix as memory-mappable "
+             "CSR/CSC .npy arrays (data/processed/rating_matrix/)"
+    )
+    args = parser.parse_args()
+    if args.chunksize is not None and args.chunksize <= 0:
+        parser.error("--chunksize must be a positive integer")
+    if args.chunksize is not None and args.engine != "pandas":
+        parser.error("--chunksize only applies to --engine pandas")
+
+    raw_dir = os.path.join("data", "raw")
+    processed_dir = os.path.join("data", "processed")
+    os.makedirs(processed_dir, exist_ok=True)
+
+    done = False
+    if args.incremental:
+        done = run_incremental(raw_dir, processed_dir, args.format, args.chunksize)
+    if not done:
+        # rating.csv must not be appended to while preprocess.py is running
+        rating_size = os.path.getsize(os.path.join(raw_dir, "rating.csv"))
+        stable_ids = args.stable_ids or args.incremental
+        if args.engine == "duckdb":
+            run_duckdb(raw_dir, processed_dir, args.format, stable_ids)
+        else:
+            run_pandas(raw_dir, processed_dir, args.format, args.chunksize, stable_ids)
+        # A full rebuild covers rating.csv up to rating_size. Runs that keep the
+        # id maps stable record that (an sha256 over both inputs); other runs
+        # only drop the old state, so a later --incremental run cannot append
+        # rows this rebuild already processed.
+        if stable_ids:
+            save_state(processed_dir, raw_dir, args.format, rating_size)
+        else:
+            clear_state(processed_dir)
+
+    if args.duckdb:
+        build_database(processed_dir, args.format, args.duckdb)
+    if args.csr:
+        build_rating_matrix(processed_dir, args.format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,405 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#   "duckdb>=1.0",
+#   "numpy>=1.24",
+#   "pandas",
+# ]
+# ///
+
+"""
+Anime Baseline Recommender
+
+Usage:
+  uv run recommend.py                                 # ランキングを構築（または読み込み）して Top 10 を表示
+  uv run recommend.py --genre Action --genre Comedy   # いずれかのジャンルを含む作品の Top 10
+  uv run recommend.py --type Movie -n 20 --by popularity
+  uv run recommend.py --user 42                       # user_id 42 が評価済みの作品を除いた Top 10
+
+前提:
+  uv run preprocess.py で data/processed/ を作っておく（--user には preprocess.py --csr も必要）。
+
+設計方針:
+  - build()            : rating_processed をアニメごとに集計し、ベイズ平均（評価件数の少ない作品を
+                         全体平均へ縮めたスコア）と評価件数（人気）を求め、全体・ジャンル別・タイプ別の
+                         ランキングをすべて事前にソートした int32 配列として持つ
+  - top_n()            : ランキングの先頭を切り出すだけ。除外集合 W があっても先頭 n + |W| 件しか見ない
+  - recommend_batch()  : 評価行列（CSR）の行をユーザーブロック単位でまとめて除外し、数千ユーザーを一括で推薦
+  - 構築結果は .npy + meta.json で保存し、mmap で即座に読み込める（入力が変わったら作り直す）
+"""
+
+import argparse
+import json
+import os
+import time
+from functools import lru_cache
+
+import duckdb
+import numpy as np
+
+from preprocess import MATRIX_DIR, IdEncoder, find_output, load_rating_matrix, scan
+
+RANKINGS = ("score", "popularity")
+META_FILE = "meta.json"
+
+
+def processed_file(processed_dir: str, name: str) -> str:
+    """data/processed/<name>.csv / <name>.parquet のうち最後に書かれた方を返す
+
+    --format を切り替えた後に残る古い方の形式を読まないよう、preprocess.find_output() で選ぶ。
+    """
+    path = find_output(processed_dir, name)
+    if path is None:
+        raise FileNotFoundError(f"{processed_dir}/{name}.csv / .parquet がありません"
+                                "（先に uv run preprocess.py を実行）")
+    return path
+
+
+def source_stamp(processed_dir: str) -> list:
+    """ランキングの元になる前処理済みファイルの名前・サイズ・mtime（保存済みの結果が古いかの判定用）
+
+    ジャンル辞書・ブリッジは無くてもよい（genre 列の展開で代用する）ので、無ければ None を記録する。
+    """
+    paths = [processed_file(processed_dir, "anime_processed"),
+             processed_file(processed_dir, "rating_processed"),
+             find_output(processed_dir, "genre"),
+             find_output(processed_dir, "anime_genre")]
+    stamp = []
+    for path in paths:
+        if path is None:
+            stamp.append(None)
+            continue
+        st = os.stat(path)
+        stamp.append([os.path.basename(path), st.st_size, st.st_mtime_ns])
+    return stamp
+
+
+def _ranked_lists(keys: np.ndarray, items: np.ndarray, n_keys: int,
+                  rank_pos: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(key, anime_idx) の組をキーごとのランキング（CSR: indptr, items）にまとめる"""
+    order = np.lexsort((rank_pos[items], keys))
+    indptr = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+    return indptr, items[order].astype(np.int32)
+
+
+class BaselineRecommender:
+    """ベイズ平均・人気順によるベースライン推薦器
+
+    すべて anime_idx をキーにした配列で、推薦時にはソートも集計もしない。
+      score[a]        : ベイズ平均 (C·m + n_a·mean_a) / (C + n_a)。m は全体平均、C は prior_weight
+      count[a]        : 評価件数（人気）
+      type_id[a]      : types の添字（不明は -1）
+      genre_mask[a, g]: アニメ a がジャンル g を含むか
+      <by>_rank       : 全体ランキング（by = score / popularity、降順の anime_idx）
+      <by>_genre_indptr / <by>_genre_items : ジャンル別ランキング（CSR、行 = genre_id）
+      <by>_type_indptr  / <by>_type_items  : タイプ別ランキング（CSR、行 = type_id）
+    """
+
+    def __init__(self, arrays: dict[str, np.ndarray], meta: dict) -> None:
+        self.arrays = arrays
+        self.meta = meta
+        self.genres = {g: i for i, g in enumerate(meta["genres"])}
+        self.types = {t: i for i, t in enumerate(meta["types"])}
+        self.names = meta["names"]
+        self._candidates = lru_cache(maxsize=256)(self._compute_candidates)
+
+    # ── 構築・保存・読み込み
+
+    @classmethod
+    def build(cls, processed_dir: str = os.path.join("data", "processed"),
+              prior_weight: float | None = None) -> "BaselineRecommender":
+        """前処理済みデータからスコアとランキングを計算する
+
+        prior_weight（C）を省略した場合は、評価のあるアニメの評価件数の中央値を使う。
+        """
+        prior_arg = prior_weight
+        anime_path = processed_file(processed_dir, "anime_processed")
+        con = duckdb.connect()
+        try:
+            anime = con.execute(f"""
+            SELECT anime_idx::INTEGER AS anime_idx, name,
+                   CASE WHEN type IS NULL THEN -1
+                        ELSE DENSE_RANK() OVER (ORDER BY type) - 1 END AS type_id
+            FROM {scan(anime_path)}
+            ORDER BY anime_idx
+            """).fetchnumpy()
+            types = [t for (t,) in con.execute(f"""
+                SELECT DISTINCT type FROM {scan(anime_path)}
+                WHERE type IS NOT NULL ORDER BY type
+            """).fetchall()]
+            n_anime = con.execute(f"""
+                SELECT COUNT(*) FROM {scan(processed_file(processed_dir, "anime_id_map"))}
+            """).fetchone()[0]
+            stats = con.execute(f"""
+            SELECT anime_idx::INTEGER AS anime_idx, COUNT(*) AS n, SUM(rating) AS total
+            FROM {scan(processed_file(processed_dir, "rating_processed"))}
+            GROUP BY anime_idx
+            """).fetchnumpy()
+            try:
+                genre_path = processed_file(processed_dir, "genre")
+                bridge_path = processed_file(processed_dir, "anime_genre")
+                genres = [g for (g,) in con.execute(
+                    f"SELECT genre FROM {scan(genre_path)} ORDER BY genre_id").fetchall()]
+                pairs = con.execute(f"""
+                    SELECT anime_idx::INTEGER AS anime_idx, genre_id::INTEGER AS genre_id
+                    FROM {scan(bridge_path)}
+                """).fetchnumpy()
+            except FileNotFoundError:
+                # 古い前処理結果: anime_processed の genre 列を展開してジャンル辞書を組み立てる
+                pairs = con.execute(f"""
+                WITH p AS (
+                    SELECT DISTINCT anime_idx::INTEGER AS anime_idx, TRIM(g) AS genre
+                    FROM {scan(anime_path)} a, UNNEST(str_split(a.genre, ',')) AS t(g)
+                    WHERE TRIM(g) <> ''
+                )
+                SELECT anime_idx, (DENSE_RANK() OVER (ORDER BY genre) - 1)::INTEGER AS genre_id, genre
+                FROM p
+                """).fetchnumpy()
+                genres = sorted(set(pairs["genre"].tolist()))
+        finally:
+            con.close()
+
+        count = np.zeros(n_anime, dtype=np.int64)
+        total = np.zeros(n_anime, dtype=np.float64)
+        count[stats["anime_idx"]] = stats["n"]
+        total[stats["anime_idx"]] = stats["total"]
+        global_mean = total.sum() / max(count.sum(), 1)
+        # --stable-ids / --incremental の anime_id_map には anime_processed から消えた id も残るので、
+        # ランキングの対象は anime_processed にある anime_idx だけにする
+        anime_idx = np.asarray(anime["anime_idx"], dtype=np.int64)
+        if prior_weight is None:
+            rated = count[anime_idx][count[anime_idx] > 0]
+            prior_weight = float(np.median(rated)) if len(rated) else 1.0
+        score = ((prior_weight * global_mean + total) / (prior_weight + count)).astype(np.float32)
+
+        type_id = np.full(n_anime, -1, dtype=np.int16)
+        type_id[anime_idx] = anime["type_id"]
+        names = [""] * n_anime
+        for idx, name in zip(anime_idx.tolist(), anime["name"].tolist()):
+            names[idx] = name
+
+        genre_items = np.asarray(pairs["anime_idx"], dtype=np.int64)
+        genre_keys = np.asarray(pairs["genre_id"], dtype=np.int64)
+        genre_mask = np.zeros((n_anime, len(genres)), dtype=bool)
+        genre_mask[genre_items, genre_keys] = True
+
+        arrays = {"score": score, "count": count.astype(np.int32),
+                  "type_id": type_id, "genre_mask": genre_mask}
+        typed_items = np.flatnonzero(type_id >= 0)
+        items = np.sort(anime_idx)
+        for by in RANKINGS:
+            # 同点は もう一方の指標 → anime_idx の順
+            keys = (score[items], count[items]) if by == "score" else (count[items], score[items])
+            ranking = items[np.lexsort((items, -keys[1], -keys[0]))].astype(np.int32)
+            rank_pos = np.full(n_anime, n_anime, dtype=np.int64)
+            rank_pos[ranking] = np.arange(len(ranking))
+            arrays[f"{by}_rank"] = ranking
+            arrays[f"{by}_genre_indptr"], arrays[f"{by}_genre_items"] = _ranked_lists(
+                genre_keys, genre_items, len(genres), rank_pos)
+            arrays[f"{by}_type_indptr"], arrays[f"{by}_type_items"] = _ranked_lists(
+                type_id[typed_items].astype(np.int64), typed_items, len(types), rank_pos)
+
+        meta = {"prior_weight": prior_weight, "prior_weight_arg": prior_arg,
+                "global_mean": float(global_mean),
+                "genres": genres, "types": types, "names": names,
+                "source": source_stamp(processed_dir)}
+        return cls(arrays, meta)
+
+    def save(self, out_dir: str) -> None:
+        os.makedirs(out_dir, exist_ok=True)
+        for key, arr in self.arrays.items():
+            np.save(os.path.join(out_dir, f"{key}.npy"), arr)
+        with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, out_dir: str, mmap: bool = True) -> "BaselineRecommender":
+        """save() の出力を開く（mmap=True では配列をメモリマップで読む）"""
+        with open(os.path.join(out_dir, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        mode = "r" if mmap else None
+        arrays = {name[:-len(".npy")]: np.load(os.path.join(out_dir, name), mmap_mode=mode)
+                  for name in os.listdir(out_dir) if name.endswith(".npy")}
+        return cls(arrays, meta)
+
+    # ── 推薦
+
+    def _ids(self, values, table: dict[str, int], kind: str) -> tuple[int, ...]:
+        try:
+            return tuple(sorted({table[v] for v in values or ()}))
+        except KeyError as e:
+            raise ValueError(f"unknown {kind} {e.args[0]!r}") from None
+
+    def _compute_candidates(self, by: str, genre_ids: tuple[int, ...],
+                            type_ids: tuple[int, ...]) -> np.ndarray:
+        """条件に合うアニメをランキング順に並べた配列（条件ごとに lru_cache される）
+
+        ジャンルはいずれかを含めば（OR）、タイプはいずれかに一致すれば対象。両方あれば AND。
+        ジャンル 1 つ・タイプ 1 つだけの条件は事前計算済みのリストを切り出すだけ。
+        """
+        if by not in RANKINGS:
+            raise ValueError(f"by must be one of {RANKINGS}, not {by!r}")
+        a = self.arrays
+        if len(genre_ids) == 1 and not type_ids:
+            g = genre_ids[0]
+            ptr = a[f"{by}_genre_indptr"]
+            return a[f"{by}_genre_items"][ptr[g]:ptr[g + 1]]
+        if len(type_ids) == 1 and not genre_ids:
+            t = type_ids[0]
+            ptr = a[f"{by}_type_indptr"]
+            return a[f"{by}_type_items"][ptr[t]:ptr[t + 1]]
+        cand = a[f"{by}_rank"]
+        if genre_ids:
+            cand = cand[a["genre_mask"][cand][:, list(genre_ids)].any(axis=1)]
+        if type_ids:
+            cand = cand[np.isin(a["type_id"][cand], type_ids)]
+        return cand
+
+    def candidates(self, by: str = "score", genres=None, types=None) -> np.ndarray:
+        """ジャンル名・タイプ名の条件に合うアニメ（anime_idx）をランキング順に返す"""
+        return self._candidates(by, self._ids(genres, self.genres, "genre"),
+                                self._ids(types, self.types, "type"))
+
+    def top_n(self, n: int = 10, genres=None, types=None, exclude=None,
+              by: str = "score") -> np.ndarray:
+        """条件に合うアニメの上位 n 件（anime_idx, int32）を返す。exclude の anime_idx は除く
+
+        除外されるのは高々 |exclude| 件なので、ランキングの先頭 n + |exclude| 件だけを調べる
+        （anime_idx は 0..アニメ数 の整数なので、isin はソートではなく表引きで判定する）。
+        """
+        cand = self.candidates(by, genres, types)
+        if exclude is None or len(exclude) == 0:
+            return cand[:n]
+        exclude = np.asarray(exclude)
+        head = cand[:n + len(exclude)]
+        return head[~np.isin(head, exclude, kind="table")][:n]
+
+    def recommend_batch(self, indptr: np.ndarray, indices: np.ndarray, n: int = 10,
+                        users=None, genres=None, types=None, by: str = "score",
+                        block_size: int = 256) -> np.ndarray:
+        """評価行列の CSR（行 = user_idx）の各行を評価済み集合として除いた上位 n 件を一括で返す
+
+        戻り値は [len(users), n] の anime_idx（int32、候補が足りない枠は -1）。
+        users を省略すると全行。ユーザーを block_size 件ずつ、ランキング先頭の
+        n + (ブロック内の最大評価件数) 列だけの密なマスクにして処理する。
+        """
+        cand = self.candidates(by, genres, types)
+        pos = np.full(len(self.arrays["score"]), -1, dtype=np.int64)
+        pos[cand] = np.arange(len(cand))
+        users = (np.arange(len(indptr) - 1) if users is None
+                 else np.asarray(users, dtype=np.int64))
+        out = np.full((len(users), n), -1, dtype=np.int32)
+
+        for start in range(0, len(users), block_size):
+            block = users[start:start + block_size]
+            lo, hi = indptr[block], indptr[block + 1]
+            lens = (hi - lo).astype(np.int64)
+            width = min(len(cand), n + int(lens.max(initial=0)))
+            if width == 0:
+                continue
+            # ブロック内の全評価（indices[lo:hi] の連結）を一度に引く
+            rows = np.repeat(np.arange(len(block)), lens)
+            flat = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens - lo, lens)
+            p = pos[indices[flat]]
+            hit = (p >= 0) & (p < width)
+            free = np.ones((len(block), width), dtype=bool)
+            free[rows[hit], p[hit]] = False
+            rank = np.cumsum(free, axis=1, dtype=np.int32)
+            r, c = np.nonzero(free & (rank <= n))
+            out[start + r, rank[r, c] - 1] = cand[c]
+        return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Anime baseline recommender (Bayesian average / popularity)")
+    parser.add_argument(
+        "-n", type=int, default=10,
+        help="推薦する件数 (default: 10)"
+    )
+    parser.add_argument(
+        "--genre", action="append", default=[],
+        help="いずれかを含む作品に絞り込むジャンル（複数回指定可）"
+    )
+    parser.add_argument(
+        "--type", action="append", default=[],
+        help="いずれかに一致する作品に絞り込むタイプ（TV / Movie / OVA など、複数回指定可）"
+    )
+    parser.add_argument(
+        "--by", choices=RANKINGS, default="score",
+        help="score: ベイズ平均 / popularity: 評価件数 (default: score)"
+    )
+    parser.add_argument(
+        "--user", type=int, default=None, metavar="USER_ID",
+        help="このユーザーが評価済みの作品を除く（preprocess.py --csr の評価行列を使う）"
+    )
+    parser.add_argument(
+        "--prior-weight", type=float, default=None,
+        help="ベイズ平均で全体平均に与える重み（仮想的な評価件数 C） "
+             "(default: 評価のあるアニメの評価件数の中央値)"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="保存済みのランキングがあっても作り直す"
+    )
+    parser.add_argument(
+        "--processed-dir", default=os.path.join("data", "processed"),
+        help="preprocess.py の出力先 (default: data/processed)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default=None,
+        help="ランキングの保存先 (default: data/processed/recommender/)"
+    )
+    args = parser.parse_args()
+    if args.n <= 0:
+        parser.error("-n must be a positive integer")
+
+    out_dir = args.output_dir or os.path.join(args.processed_dir, "recommender")
+    meta_path = os.path.join(out_dir, META_FILE)
+    try:
+        stamp = source_stamp(args.processed_dir)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    model = None
+    if not args.rebuild and os.path.exists(meta_path):
+        model = BaselineRecommender.load(out_dir)
+        if (model.meta["source"], model.meta["prior_weight_arg"]) != (stamp, args.prior_weight):
+            model = None
+    if model is None:
+        print("Building rankings ...")
+        t0 = time.perf_counter()
+        model = BaselineRecommender.build(args.processed_dir, args.prior_weight)
+        print(f"  {len(model.names):,} anime in {time.perf_counter() - t0:.1f}s "
+              f"(global mean {model.meta['global_mean']:.3f}, C = {model.meta['prior_weight']:g})")
+        print(f"Saving {out_dir}/ ...")
+        model.save(out_dir)
+
+    exclude = None
+    if args.user is not None:
+        if not os.path.isdir(os.path.join(args.processed_dir, MATRIX_DIR)):
+            parser.error(f"{args.processed_dir}/{MATRIX_DIR}/ がありません"
+                         "（先に uv run preprocess.py --csr を実行）")
+        user_map = IdEncoder.load(processed_file(args.processed_dir, "user_id_map"))
+        user_idx = user_map.transform([args.user], strict=False)[0]
+        if user_idx < 0:
+            parser.error(f"user_id {args.user} は評価データにありません")
+        indptr, indices, _, _ = load_rating_matrix(args.processed_dir)
+        exclude = indices[indptr[user_idx]:indptr[user_idx + 1]]
+
+    try:
+        t0 = time.perf_counter()
+        top = model.top_n(args.n, args.genre, args.type, exclude, args.by)
+        elapsed = time.perf_counter() - t0
+    except ValueError as e:
+        parser.error(str(e))
+
+    score, count, type_id = (model.arrays[k] for k in ("score", "count", "type_id"))
+    print(f"\nTop {args.n} by {args.by} ({elapsed * 1e6:,.0f} µs)")
+    for rank, a in enumerate(top, 1):
+        kind = model.meta["types"][type_id[a]] if type_id[a] >= 0 else "-"
+        print(f"  {rank:>3}. {model.names[a]}  [{kind}]  "
+              f"score {score[a]:.3f}  ratings {count[a]:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# /// script
+# requires-python = ">=3.10"
+# dependencies = [
+#   "duckdb>=1.0",
+#   "numpy",
+#   "pandas",
+#   "scipy",
+# ]
+# ///
+
+"""
+Anime Item–Item Similarity
+
+Usage:
+  uv run similarity.py                          # コサイン類似度で各アニメの近傍 Top 50
+  uv run similarity.py --metric adjusted -k 100 # 調整コサイン（ユーザー平均を引く）で Top 100
+  uv run similarity.py --workers 4 --block-size 256
+
+前提:
+  uv run preprocess.py --csr で data/processed/rating_matrix/ を作っておく。
+
+設計方針:
+  - item_matrix()  : CSC 配列をそのまま「アニメ × ユーザー」の CSR として読み、行を L2 正規化
+  - _top_k_block() : 行ブロックごとに疎行列積で類似度を求め、argpartition で Top-k だけ残す
+                     → アニメ × アニメの密行列は作らない（メモリはブロック幅 × アニメ数まで）
+  - 各ブロックはプロセスプールで並列に計算（行列は親プロセスで 1 回だけ組み立てて .npy に書き出し、
+                     各ワーカーはそれを mmap で開くだけ → メモリはワーカー数に比例しない）
+  - 出力は anime_idx をキーにした近傍インデックス（indices.npy / scores.npy、mmap 可能）
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+from preprocess import load_rating_matrix
+
+METRICS = ("cosine", "adjusted")
+
+
+def item_matrix(processed_dir: str, metric: str) -> sp.csr_matrix:
+    """アニメ × ユーザーの評価行列（float32, 行は L2 正規化済み）を返す
+
+    metric="adjusted" の場合は各評価から評価したユーザーの平均評価を引いてから正規化する
+    （調整コサイン類似度）。評価していない要素は 0 のまま。
+    """
+    indptr, indices, data, (n_users, n_anime) = load_rating_matrix(processed_dir, "csc")
+    values = data.astype(np.float32)
+    if metric == "adjusted":
+        counts = np.bincount(indices, minlength=n_users)
+        sums = np.bincount(indices, weights=values, minlength=n_users)
+        means = (sums / np.maximum(counts, 1)).astype(np.float32)
+        values -= means[indices]
+
+    items = sp.csr_matrix((values, indices, indptr), shape=(n_anime, n_users))
+    norms = np.sqrt(np.asarray(items.multiply(items).sum(axis=1)).ravel())
+    inv = np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0)
+    items.data *= np.repeat(inv, np.diff(indptr)).astype(np.float32)
+    return items
+
+
+def save_matrix(out_dir: str, matrix: sp.csr_matrix) -> None:
+    """CSR 行列を data / indices / indptr の .npy として書き出す（load_matrix() で mmap できる）"""
+    os.makedirs(out_dir, exist_ok=True)
+    for name in ("data", "indices", "indptr"):
+        np.save(os.path.join(out_dir, f"{name}.npy"), getattr(matrix, name))
+
+
+def load_matrix(out_dir: str, shape: tuple[int, int]) -> sp.csr_matrix:
+    """save_matrix() の出力を読み取り専用の mmap のまま CSR 行列にする（配列はコピーしない）"""
+    arrays = [np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode="r")
+              for name in ("data", "indices", "indptr")]
+    return sp.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+# ── ワーカープロセス側の状態（initializer で一度だけ開く）
+_items: sp.csr_matrix | None = None
+_items_t: sp.csr_matrix | None = None
+
+
+def _init_worker(matrix_dir: str, shape: tuple[int, int]) -> None:
+    # 親プロセスが正規化・転置済みの行列を書き出しておき、各ワーカーはそれを mmap で開く
+    # → 物理メモリ上の行列はページキャッシュの 1 組だけで、ワーカー数に比例して増えない
+    global _items, _items_t
+    _items = load_matrix(os.path.join(matrix_dir, "items"), shape)
+    _items_t = load_matrix(os.path.join(matrix_dir, "items_t"), shape[::-1])
+
+
+def _top_k_block(start: int, stop: int, k: int) -> tuple[int, np.ndarray, np.ndarray]:
+    """anime_idx が [start, stop) のアニメについて類似度 Top-k の近傍を返す
+
+    類似度が 0 以下（共通の評価者がいない等）の枠は index -1 / score 0 で埋める。
+    """
+    sims = (_items[start:stop] @ _items_t).toarray()
+    rows = np.arange(stop - start)
+    sims[rows, start + rows] = -np.inf  # 自分自身は近傍にしない
+
+    k_eff = min(k, sims.shape[1] - 1)
+    idx = np.full((stop - start, k), -1, dtype=np.int32)
+    scores = np.zeros((stop - start, k), dtype=np.float32)
+    if k_eff <= 0:
+        return start, idx, scores
+    part = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+    top = np.take_along_axis(sims, part, axis=1)
+    order = np.argsort(-top, axis=1, kind="stable")
+    part = np.take_along_axis(part, order, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+
+    keep = top > 0
+    idx[:, :k_eff] = np.where(keep, part, -1)
+    scores[:, :k_eff] = np.where(keep, top, 0)
+    return start, idx, scores
+
+
+def compute_neighbors(processed_dir: str, metric: str = "cosine", k: int = 50,
+                      block_size: int = 512,
+                      workers: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """全アニメの Top-k 近傍 (indices[n_anime, k] int32, scores[n_anime, k] float32) を計算する"""
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}, not {metric!r}")
+    global _items, _items_t
+    items = item_matrix(processed_dir, metric)
+    items_t = items.T.tocsr()
+    shape = items.shape
+    n_anime = shape[0]
+    indices = np.full((n_anime, k), -1, dtype=np.int32)
+    scores = np.zeros((n_anime, k), dtype=np.float32)
+    blocks = [(start, min(start + block_size, n_anime), k)
+              for start in range(0, n_anime, block_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        _items, _items_t = items, items_t
+        for start, idx, sim in (_top_k_block(*b) for b in blocks):
+            indices[start:start + len(idx)] = idx
+            scores[start:start + len(idx)] = sim
+        return indices, scores
+
+    # 行列は親プロセスで 1 回だけ組み立て、processed_dir 内の一時ディレクトリ経由でワーカーと共有する
+    with tempfile.TemporaryDirectory(prefix=".similarity-", dir=processed_dir) as matrix_dir:
+        save_matrix(os.path.join(matrix_dir, "items"), items)
+        save_matrix(os.path.join(matrix_dir, "items_t"), items_t)
+        del items, items_t
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(matrix_dir, shape)) as pool:
+            for start, idx, sim in pool.map(_top_k_block, *zip(*blocks)):
+                indices[start:start + len(idx)] = idx
+                scores[start:start + len(idx)] = sim
+    return indices, scores
+
+
+def save_neighbors(out_dir: str, indices: np.ndarray, scores: np.ndarray) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "indices.npy"), indices)
+    np.save(os.path.join(out_dir, "scores.npy"), scores)
+
+
+def load_neighbors(out_dir: str, mmap: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """save_neighbors() の出力を開く。indices[anime_idx] がそのアニメの近傍（類似度順）"""
+    mode = "r" if mmap else None
+    return (np.load(os.path.join(out_dir, "indices.npy"), mmap_mode=mode),
+            np.load(os.path.join(out_dir, "scores.npy"), mmap_mode=mode))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Anime item-item similarity (top-k neighbours)")
+    parser.add_argument(
+        "--metric", choices=METRICS, default="cosine",
+        help="cosine: コサイン類似度 / adjusted: ユーザー平均を引いた調整コサイン (default: cosine)"
+    )
+    parser.add_argument(
+        "-k", type=int, default=50,
+        help="アニメごとに残す近傍数 (default: 50)"
+    )
+    parser.add_argument(
+        "--block-size", type=int, default=512,
+        help="1 回の疎行列積で処理するアニメ数。メモリ使用量は block-size × アニメ数 × 4 バイト程度 "
+             "(default: 512)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="ブロックを並列に計算するプロセス数 (default: CPU コア数)"
+    )
+    parser.add_argument(
+        "--processed-dir", default=os.path.join("data", "processed"),
+        help="preprocess.py --csr の出力先 (default: data/processed)"
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default=None,
+        help="近傍インデックスの出力先 (default: data/processed/item_neighbors_<metric>/)"
+    )
+    args = parser.parse_args()
+    if args.k <= 0:
+        parser.error("-k must be a positive integer")
+    if args.block_size <= 0:
+        parser.error("--block-size must be a positive integer")
+    if not os.path.isdir(os.path.join(args.processed_dir, "rating_matrix")):
+        parser.error(f"{args.processed_dir}/rating_matrix/ がありません"
+                     "（先に uv run preprocess.py --csr を実行）")
+
+    out_dir = args.output_dir or os.path.join(args.processed_dir, f"item_neighbors_{args.metric}")
+    print(f"Computing {args.metric} top-{args.k} neighbours ...")
+    t0 = time.perf_counter()
+    indices, scores = compute_neighbors(args.processed_dir, args.metric, args.k,
+                                        args.block_size, args.workers)
+    print(f"  {len(indices):,} anime in {time.perf_counter() - t0:.1f}s")
+    print(f"Saving {out_dir}/ ...")
+    save_neighbors(out_dir, indices, scores)
+
+
+if __name__ == "__main__":
+    main()